@@ -0,0 +1,238 @@
+"""
+Benchmark of the aggregation and decomposition hot paths on synthetic data
+
+Each stage is timed (best of --repeat runs) and memory-profiled (tracemalloc peak)
+for every size of the grid. Engines are benchmarked side by side and their results
+are checked against the reference engine. Results are written as JSON, tagged with
+the git commit, so two runs can be compared with --compare.
+
+    python -m benchmarks.bench_pipeline --sizes small medium --output bench.json
+    python -m benchmarks.bench_pipeline --compare before.json after.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import pandas as pd
+from src import out_of_core, schema
+from src.data_processing import dataProcessing
+from .synthetic import generate_metrics
+
+ROOT = Path(__file__).resolve().parent.parent
+
+"""
+Synthetic dataset sizes, as keyword arguments of generate_metrics
+"""
+SIZES = {
+    'tiny': {'weeks': 4, 'countries': 3, 'browsers': 2, 'extra_dimensions': {'device': 2}},
+    'small': {'weeks': 20, 'countries': 10, 'browsers': 4, 'extra_dimensions': {'device': 3}},
+    'medium': {'weeks': 52, 'countries': 100, 'browsers': 12, 'extra_dimensions': {'device': 4}},
+    'large': {'weeks': 104, 'countries': 250, 'browsers': 30, 'extra_dimensions': {'device': 5}},
+}
+
+def decompose(processor, metrics_df: pd.DataFrame, dimensions: list, **options) -> pd.DataFrame:
+    """Calls the decompose_* method dedicated to the dimensions, or the generic one."""
+    if dimensions == ['country']:
+        return processor.decompose_and_calculate_effects_by_country(metrics_df, **options)
+    if dimensions == ['country', 'browser']:
+        return processor.decompose_and_calculate_effects_by_country_browser(metrics_df, **options)
+    return processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, **options)
+
+
+"""
+Number of worker processes of the parallel engine
+"""
+PARALLEL_WORKERS = 2
+
+
+def decompose_out_of_core(processor, metrics_df: pd.DataFrame, dimensions: list) -> pd.DataFrame:
+    """Runs the out-of-core engine end to end: csv export, week partitions, decomposition and read back."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_location = os.path.join(tmp_dir, 'metrics.csv')
+        output_file = os.path.join(tmp_dir, 'results.csv')
+        metrics_df.to_csv(file_location, index=False)
+        out_of_core.partition_by_week(file_location, os.path.join(tmp_dir, 'partitions'), dimensions)
+        out_of_core.decompose_out_of_core(os.path.join(tmp_dir, 'partitions'), dimensions, output_file)
+        return out_of_core.read_results(output_file, dimensions)
+
+
+def decompose_multi_metric(processor, metrics_df: pd.DataFrame, dimensions: list) -> pd.DataFrame:
+    """Runs decompose_metrics_by_dimension on the conversion rate, with the effect columns of the other engines."""
+    effect_columns = schema.effect_columns('conversions', 'visits')
+    return processor.decompose_metrics_by_dimension(metrics_df, dimensions, [('conversions', 'visits')]).rename(
+        columns=dict(zip(effect_columns, ['rate_change_effect', 'proportion_change_effect'])))
+
+
+def decompose_with_backend(backend: str):
+    """Returns an engine running the vectorized decomposition with the given effect kernel backend."""
+    processor = dataProcessing(plot=False, effects_backend=backend)
+    return lambda _, metrics_df, dimensions: decompose(processor, metrics_df, dimensions)
+
+
+"""
+Decomposition engines, as functions of (processor, metrics_df, dimensions). The first
+one is the reference the others are parity-checked against. New engines register here.
+"""
+ENGINES = {
+    'loop': lambda processor, metrics_df, dimensions: decompose(processor, metrics_df, dimensions, engine='loop'),
+    'vectorized': lambda processor, metrics_df, dimensions: decompose(processor, metrics_df, dimensions),
+    'vectorized_sparse': lambda processor, metrics_df, dimensions: processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, sparse=True),
+    'parallel': lambda processor, metrics_df, dimensions: processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, workers=PARALLEL_WORKERS),
+    'out_of_core': decompose_out_of_core,
+    'multi_metric': decompose_multi_metric,
+    'kernel_numpy': decompose_with_backend('numpy'),
+}
+if importlib.util.find_spec('numba'):
+    ENGINES['kernel_numba'] = decompose_with_backend('numba')
+
+"""
+Engines whose output only keeps the visited segments, compared on the per-pair effect sums
+"""
+SPARSE_ENGINES = {'vectorized_sparse'}
+
+"""
+The loop engine is skipped above this number of (week pair, segment) rows
+"""
+MAX_LOOP_ROWS = 20000
+
+
+def stages(metrics_df: pd.DataFrame, extra_dimensions: list) -> dict:
+    """Returns the benchmarked stages as {(stage, engine): function of the processor}."""
+    all_dimensions = ['country', 'browser', *extra_dimensions]
+    benchmarks = {
+        ('transform_data', None): lambda processor: processor.transform_data(metrics_df),
+        ('analyze_metrics_per_country', None): lambda processor: processor.analyze_metrics_per_country(metrics_df),
+    }
+    for engine, engine_decompose in ENGINES.items():
+        for stage, dimensions in (('decompose_by_country', ['country']),
+                                  ('decompose_by_country_browser', ['country', 'browser']),
+                                  ('decompose_by_dimension', all_dimensions)):
+            benchmarks[(stage, engine)] = lambda processor, engine_decompose=engine_decompose, dimensions=dimensions: engine_decompose(processor, metrics_df, dimensions)
+    return benchmarks
+
+
+def measure(function, repeat: int):
+    """Times the function (best of `repeat`) and measures its peak traced memory.
+
+    Returns:
+        A tuple of (seconds, peak bytes, result of the last call)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def check_parity(reference: pd.DataFrame, result: pd.DataFrame, engine: str) -> bool:
+    """Checks an engine's output against the reference engine's output."""
+    try:
+        if engine in SPARSE_ENGINES:
+            effects = ['rate_change_effect', 'proportion_change_effect']
+            pd.testing.assert_frame_equal(
+                result.groupby('week_before')[effects].sum(), reference.groupby('week_before')[effects].sum())
+        else:
+            pd.testing.assert_frame_equal(result, reference, check_dtype=False, check_categorical=False)
+    except AssertionError:
+        return False
+    return True
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(sizes: list, repeat: int = 3, max_loop_rows: int = MAX_LOOP_ROWS) -> dict:
+    """Runs every stage for every size.
+
+    The reference of a stage is the first engine of ENGINES that ran, i.e. the loop
+    engine unless it was skipped above max_loop_rows. Each record names it.
+
+    Returns:
+        A dict with the run metadata and one record per (size, stage, engine)
+    """
+    processor = dataProcessing(plot=False)
+    records = []
+    for size in sizes:
+        parameters = SIZES[size]
+        metrics_df = generate_metrics(**parameters)
+        extra_dimensions = list(parameters.get('extra_dimensions') or {})
+        # Rows of the widest decomposition, which bounds the cost of the loop engine
+        n_segments = metrics_df[['country', 'browser', *extra_dimensions]].nunique().prod()
+        references = {}
+        for (stage, engine), function in stages(metrics_df, extra_dimensions).items():
+            if engine == 'loop' and (parameters['weeks'] - 1) * n_segments > max_loop_rows:
+                continue
+
+            seconds, peak_bytes, result = measure(lambda: function(processor), repeat)
+            record = {'size': size, 'rows': len(metrics_df), 'stage': stage, 'engine': engine,
+                      'seconds': seconds, 'peak_bytes': peak_bytes, 'parity': None, 'reference_engine': None}
+            if engine is not None:
+                if stage not in references:
+                    references[stage] = (engine, result)
+                else:
+                    record['parity'] = check_parity(references[stage][1], result, engine)
+                record['reference_engine'] = references[stage][0]
+            records.append(record)
+
+    return {'commit': git_commit(), 'python': platform.python_version(), 'pandas': pd.__version__, 'records': records}
+
+
+def compare(before: dict, after: dict) -> pd.DataFrame:
+    """Joins two runs on (size, stage, engine) and computes the speedup and memory ratio."""
+    keys = ['size', 'stage', 'engine']
+    before_df = pd.DataFrame(before['records']).fillna({'engine': ''})
+    after_df = pd.DataFrame(after['records']).fillna({'engine': ''})
+    merged = before_df.merge(after_df, on=keys, suffixes=('_before', '_after'))
+    merged['speedup'] = merged['seconds_before'] / merged['seconds_after']
+    merged['memory_ratio'] = merged['peak_bytes_after'] / merged['peak_bytes_before']
+    return merged[keys + ['seconds_before', 'seconds_after', 'speedup', 'memory_ratio']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['tiny', 'small'], choices=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best one is kept')
+    parser.add_argument('--max-loop-rows', type=int, default=MAX_LOOP_ROWS, help='skip the loop engine above this many result rows')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two JSON result files')
+    args = parser.parse_args(argv)
+
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        if args.compare:
+            runs = []
+            for file_location in args.compare:
+                with open(file_location) as file:
+                    runs.append(json.load(file))
+            print(compare(*runs).to_string(index=False))
+            return
+
+        results = run(args.sizes, args.repeat, args.max_loop_rows)
+        print(pd.DataFrame(results['records']).to_string(index=False))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if any(record['parity'] is False for record in results['records']):
+        sys.exit('Parity check failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Startup benchmark: import time of the package and of a main run without plotting
+
+Every measurement runs in a fresh interpreter so module caches do not hide the cost.
+
+    python -m benchmarks.bench_startup --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+"""
+Python snippets to time, each one reports its own duration and which of LAZY_MODULES were loaded
+"""
+SCENARIOS = {
+    'import_package': 'import src.data_processing',
+    'main_without_plots': 'import main; main.main(plot=False)',
+}
+
+"""
+Modules only the optional code paths import: plotting and the numba effects backend
+"""
+LAZY_MODULES = ('matplotlib', 'numba')
+
+TIMER = '''
+import sys, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, *(module in sys.modules for module in {modules!r}))
+'''
+
+
+def measure(code: str, repeat: int) -> dict:
+    """Runs the code in `repeat` fresh interpreters.
+
+    Returns:
+        A dict with the individual and median durations in seconds, and a
+        <module>_loaded flag per module of LAZY_MODULES telling whether it ended up imported
+    """
+    durations = []
+    loaded = dict.fromkeys(LAZY_MODULES, False)
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', TIMER.format(code=code, modules=LAZY_MODULES)], cwd=ROOT,
+            capture_output=True, text=True, check=True).stdout.split()
+        flags = output[-len(LAZY_MODULES):]
+        durations.append(float(output[-len(LAZY_MODULES) - 1]))
+        for module, flag in zip(LAZY_MODULES, flags):
+            loaded[module] = loaded[module] or flag == 'True'
+    return {'seconds': durations, 'median_seconds': statistics.median(durations),
+            **{f'{module}_loaded': flag for module, flag in loaded.items()}}
+
+
+def run(repeat: int = 5) -> dict:
+    return {name: measure(code, repeat) for name, code in SCENARIOS.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh interpreters per scenario')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--max-seconds', type=float, help='fail when a median exceeds this duration')
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    for name, result in results.items():
+        loaded = [module for module in LAZY_MODULES if result[f'{module}_loaded']]
+        print(f"{name:<22} median {result['median_seconds']:.3f}s  lazy modules loaded: {', '.join(loaded) or 'none'}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    failures = [name for name, result in results.items()
+                if any(result[f'{module}_loaded'] for module in LAZY_MODULES) or (args.max_seconds and result['median_seconds'] > args.max_seconds)]
+    if failures:
+        sys.exit(f"Startup regression in: {', '.join(failures)}")
+
+
+if __name__ == '__main__':
+    main()
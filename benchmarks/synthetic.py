@@ -0,0 +1,47 @@
+"""
+Synthetic weekly metrics shaped like the raw csv dataset, for benchmarks and tests
+"""
+import numpy as np
+import pandas as pd
+
+
+def dimension_values(prefix: str, count: int) -> list:
+    """Returns `count` distinct labels such as country_0000, country_0001, ..."""
+    return [f'{prefix}{index:04d}' for index in range(count)]
+
+
+def generate_metrics(weeks: int = 20, countries: int = 10, browsers: int = 4, extra_dimensions: dict = None,
+                     density: float = 1.0, seed: int = 0) -> pd.DataFrame:
+    """Generates one row per (week, segment) with random visits and conversions.
+
+    Args:
+        weeks: number of weeks
+        countries: number of distinct countries
+        browsers: number of distinct browsers
+        extra_dimensions: additional dimension columns as {name: number of distinct values}
+        density: share of the segments present in each week, the others are left out
+            the way segments without traffic are missing from the real exports
+        seed: seed of the random generator
+
+    Returns:
+        A DataFrame with the week, browser, country, extra dimensions, visits and
+        conversions columns
+    """
+    rng = np.random.default_rng(seed)
+    dimensions = {'browser': dimension_values('browser_', browsers), 'country': dimension_values('country_', countries)}
+    dimensions.update({name: dimension_values(f'{name}_', count) for name, count in (extra_dimensions or {}).items()})
+
+    # Cartesian product of weeks and dimension values
+    shape = (weeks, *(len(values) for values in dimensions.values()))
+    grid = np.indices(shape).reshape(len(shape), -1)
+    keep = rng.random(grid.shape[1]) < density
+    grid = grid[:, keep]
+
+    metrics_df = pd.DataFrame({'week': grid[0]})
+    for position, (name, values) in enumerate(dimensions.items(), start=1):
+        metrics_df[name] = np.asarray(values, dtype=object)[grid[position]]
+
+    visits = rng.integers(1, 100000, size=len(metrics_df))
+    metrics_df['visits'] = visits
+    metrics_df['conversions'] = rng.binomial(visits, rng.uniform(0.01, 0.3, size=len(metrics_df)))
+    return metrics_df
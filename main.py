@@ -1,14 +1,49 @@
-from src import data_processing, schema
-
-def main():
-    dataProcessObj = data_processing.dataProcessing()
-    metrics_df = dataProcessObj.read_csv_from_filepath('S&A - Written Project - Data Set - raw_data.csv')
-    aggregate = dataProcessObj.transform_data(metrics_df)
-    weekly_country_data = dataProcessObj.analyze_metrics_per_country(metrics_df)
-    decomposed_effects_by_country = dataProcessObj.decompose_and_calculate_effects_by_country(metrics_df)
-    decomposed_effects_by_country_browser = dataProcessObj.decompose_and_calculate_effects_by_country_browser(metrics_df)
-    decomposed_effects_by_dimension = dataProcessObj.decompose_and_calculate_effects_by_dimension(metrics_df, ['country', 'browser'])
+import argparse
+from src import data_processing, instrumentation, schema
+
+def main(plot=True, plot_dir=None, plot_format='png', plot_workers=None, instrument=False, report_file=None, profile_file=None, workers=None):
+    if instrument or report_file or profile_file:
+        instrumentation.enable(profile=bool(profile_file))
+    dataProcessObj = data_processing.dataProcessing(plot=plot, plot_dir=plot_dir, plot_format=plot_format, plot_workers=plot_workers)
+    metrics_df = dataProcessObj.read_csv_from_filepath_cached('S&A - Written Project - Data Set - raw_data.csv')
+    # Scan the raw rows once, every analysis reads its totals from the cube
+    metrics_cube = dataProcessObj.build_cube(metrics_df)
+    aggregate = dataProcessObj.transform_data(metrics_cube)
+    weekly_country_data = dataProcessObj.analyze_metrics_per_country(metrics_cube)
+    if workers:
+        # Decompose the dimension sets concurrently across a process pool, the
+        # country and browser decomposition is the same for both analyses
+        from src.parallel import decompose_in_parallel
+        decomposed_effects_by_country, decomposed_effects_by_country_browser = decompose_in_parallel(
+            metrics_cube.frame, [['country'], ['country', 'browser']], workers, effects_backend=dataProcessObj.effects_backend)
+        decomposed_effects_by_dimension = decomposed_effects_by_country_browser
+    else:
+        decomposed_effects_by_country = dataProcessObj.decompose_and_calculate_effects_by_country(metrics_cube)
+        decomposed_effects_by_country_browser = dataProcessObj.decompose_and_calculate_effects_by_country_browser(metrics_cube)
+        decomposed_effects_by_dimension = dataProcessObj.decompose_and_calculate_effects_by_dimension(metrics_cube, ['country', 'browser'])
     dataProcessObj.analyze_decomposition_by_dimension(decomposed_effects_by_dimension, ['country'])
     dataProcessObj.analyze_decomposition_by_dimension(decomposed_effects_by_dimension,  ['country', 'browser'])
+    dataProcessObj.wait_for_plots()
+
+    if instrumentation.is_enabled():
+        instrumentation.disable()
+        if report_file:
+            instrumentation.export_report(report_file)
+        if profile_file:
+            instrumentation.dump_profile(profile_file)
+        print(instrumentation.summary_table())
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Weekly conversion rate analysis')
+    parser.add_argument('--no-plot', dest='plot', action='store_false', help='only compute the DataFrames, skip the charts')
+    parser.add_argument('--plot-dir', help='write the charts to this directory instead of showing them')
+    parser.add_argument('--plot-format', default='png', help='image format of the written charts (png, svg, ...)')
+    parser.add_argument('--plot-workers', type=int, help='number of processes rendering the written charts')
+    parser.add_argument('--instrument', action='store_true', help='print the time, rows and peak memory of every stage')
+    parser.add_argument('--report', dest='report_file', help='write the stage report to this .json or .csv file')
+    parser.add_argument('--workers', type=int, help='number of processes decomposing the dimension sets concurrently')
+    parser.add_argument('--profile', dest='profile_file', help='write a cProfile dump of the run to this file')
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(**vars(parse_args()))
@@ -0,0 +1,79 @@
+"""
+Week x segment aggregate cube with memoized rollups, shared by the analysis methods
+"""
+from collections import OrderedDict
+import pandas as pd
+from . import schema
+
+
+class aggregateCube:
+    """Sums of visits, conversions and the optional metrics at the finest (week, *dimensions) grain.
+
+    The raw rows are scanned once, when the cube is built. Rollups to any subset of
+    the keys are computed from the cube and memoized in a least recently used cache
+    bounded by memory. Like the raw data, the groups of every rollup keep the order
+    in which they first appear, so results computed from the cube match the ones
+    computed from the raw rows.
+    """
+
+    def __init__(self, metrics_df: pd.DataFrame, dimensions: list = ('country', 'browser'), max_bytes: int = 256 * 2 ** 20):
+        """
+        Args:
+            metrics_df: Dataframe of the csv dataset
+            dimensions: dimension columns of the finest grain
+            max_bytes: memory budget of the memoized rollups, the cube itself excluded
+        """
+        self.keys = ['week', *dimensions]
+        self.metrics = ['visits', 'conversions', *(column for column in schema.optional_metrics_schema if column in metrics_df.columns)]
+        self.frame = metrics_df.groupby(self.keys, sort=False, observed=True, dropna=False)[self.metrics].sum().reset_index()
+        self.max_bytes = max_bytes
+        self._rollups = OrderedDict()
+        self._rollup_bytes = 0
+        self.stats = {'hit': 0, 'miss': 0, 'eviction': 0}
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def rollup(self, keys: list) -> pd.DataFrame:
+        """Returns the metrics summed per unique combination of the keys.
+
+        Args:
+            keys : subset of the cube keys to group upon
+
+        Returns:
+            A DataFrame with the keys and metrics columns. It is a copy, so
+            callers can modify it without altering the cache.
+        """
+        keys = list(keys)
+        unknown = [key for key in keys if key not in self.keys]
+        if not keys or unknown:
+            raise ValueError(f"Cannot roll up on {keys}, the cube is built on {self.keys}")
+        if keys == self.keys:
+            return self.frame.copy()
+
+        cache_key = tuple(keys)
+        if cache_key in self._rollups:
+            self.stats['hit'] += 1
+            self._rollups.move_to_end(cache_key)
+            return self._rollups[cache_key].copy()
+
+        self.stats['miss'] += 1
+        rollup_df = self.frame.groupby(keys, sort=False, observed=True, dropna=False)[self.metrics].sum().reset_index()
+        self._store(cache_key, rollup_df)
+        return rollup_df.copy()
+
+    def _store(self, cache_key: tuple, rollup_df: pd.DataFrame):
+        """Memoizes a rollup and evicts the least recently used ones above the memory budget."""
+        size = int(rollup_df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        self._rollups[cache_key] = rollup_df
+        self._rollup_bytes += size
+        while self._rollup_bytes > self.max_bytes:
+            _, evicted = self._rollups.popitem(last=False)
+            self._rollup_bytes -= int(evicted.memory_usage(deep=True).sum())
+            self.stats['eviction'] += 1
+
+    @property
+    def cached_bytes(self) -> int:
+        return self._rollup_bytes
@@ -1,28 +1,288 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
 import pandas as pd
-from urllib.request import urlretrieve
-from urllib.parse import urlparse
 from pathlib import Path
-from . import schema
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter, MultipleLocator
+from . import instrumentation, kernels, schema
+from .cube import aggregateCube
+
+
+logger = logging.getLogger(__name__)
+
+
+def _read_shard(file_location: str, dtypes: dict, keys: list) -> pd.DataFrame:
+    """Parses one csv shard and sums its metrics per key, in a worker of read_csv_from_filepaths."""
+    shard_df = pd.read_csv(file_location, sep=',', dtype=dtypes)
+    metrics = ['visits', 'conversions', *(column for column in schema.optional_metrics_schema if column in shard_df.columns)]
+    return shard_df.groupby(keys, sort=False, observed=True, dropna=False)[metrics].sum().reset_index()
 
 
 class dataProcessing:
 
-    def read_csv_from_filepath(self, file_location: str) -> pd.DataFrame:
+    def __init__(self, plot: bool = True, plot_dir: str = None, plot_format: str = 'png', plot_workers: int = None,
+                 effects_backend: str = None):
+        """
+        Args:
+            plot : draw the charts of the analysis methods, disable to only compute the DataFrames
+            plot_dir : write the charts to this directory instead of showing them in a window
+            plot_format : image format of the written charts, e.g. png or svg
+            plot_workers : number of processes rendering the written charts concurrently
+            effects_backend : 'numpy' or 'numba' backend of the effect kernel, defaults to kernels.BACKEND
+
+        Raises:
+            ValueError: when effects_backend is not one of kernels.BACKENDS
+        """
+        kernels.validate_backend(effects_backend)
+        self.plot = plot
+        self.plot_dir = plot_dir
+        self.plot_format = plot_format
+        self.plot_workers = plot_workers
+        self.effects_backend = effects_backend
+        self._plot_executor = None
+        self._plot_jobs = []
+
+        # Outcomes of read_csv_from_filepath_cached
+        self.cache_stats = {'hit': 0, 'miss': 0, 'disabled': 0}
+
+    @instrumentation.instrument(count_result=True)
+    def read_csv_from_filepath(self, file_location: str, compact: bool = False) -> pd.DataFrame:
         """Reads csv file from the specified path.
 
         Args:
             spark: SparkSession.
             path: Location of the file
+            compact: load the dimensions as categoricals and the counters as narrow
+                unsigned integers (see schema.compact_metrics_schema)
 
         Returns:
             A pandas DataFrame
         """
 
         # if the specified path exists, return the DataFrame else throw an exception
-        return pd.read_csv(file_location, sep=',', dtype=schema.metrics_schema)
+        metrics_df = pd.read_csv(file_location, sep=',', dtype=self._read_dtypes(compact))
+        return schema.to_compact_dtypes(metrics_df) if compact else metrics_df
+
+    def _read_dtypes(self, compact: bool) -> dict:
+        """Returns the dtypes used to parse the csv file.
 
+        Counters are always parsed as wide integers, since read_csv silently wraps
+        values that do not fit a narrow dtype. They are downcast after validation.
+        The optional metric columns are parsed when the file has them.
+        """
+        if not compact:
+            return {**schema.metrics_schema, **schema.optional_metrics_schema}
+        return {**{column: (dtype if dtype == 'category' else schema.metrics_schema[column])
+                   for column, dtype in schema.compact_metrics_schema.items()},
+                **schema.optional_metrics_schema}
+
+    @instrumentation.instrument(count_result=True)
+    def read_csv_from_filepath_cached(self, file_location: str, cache_dir: str = None, compact: bool = False) -> pd.DataFrame:
+        """Reads csv file through a typed columnar (Feather) cache.
+
+        The first read parses the csv and writes an uncompressed Feather file next to a
+        manifest holding the source path, size, mtime and content hash. Later reads
+        memory-map the Feather file as long as the source is unchanged. A changed
+        mtime alone is not a miss: the content hash is compared before re-parsing.
+        The outcome is logged and counted in self.cache_stats.
+
+        Falls back to read_csv_from_filepath when pyarrow is not installed.
+
+        Args:
+            file_location: Location of the file
+            cache_dir: Directory of the cache files, defaults to a .columnar_cache
+                directory next to the csv file
+            compact: cache the compact schema instead of the default one
+
+        Returns:
+            A pandas DataFrame
+        """
+        try:
+            from pyarrow import feather
+        except ImportError:
+            logger.warning("pyarrow is not installed, reading %s without the columnar cache", file_location)
+            self.cache_stats['disabled'] += 1
+            return self.read_csv_from_filepath(file_location, compact=compact)
+
+        source = Path(file_location).resolve()
+        cache_dir = Path(cache_dir) if cache_dir else source.parent / '.columnar_cache'
+        cache_key = hashlib.sha256(f'{source}|compact={compact}'.encode()).hexdigest()[:16]
+        cache_file = cache_dir / f'{source.stem}-{cache_key}.feather'
+        manifest_file = cache_file.with_suffix('.json')
+
+        stat = source.stat()
+        manifest = {'path': str(source), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'compact': compact}
+        cached_manifest = self._read_cache_manifest(manifest_file) if cache_file.exists() else None
+
+        status = 'miss'
+        if cached_manifest is not None:
+            if all(cached_manifest.get(key) == value for key, value in manifest.items()):
+                status = 'hit'
+            else:
+                # The file was touched or rewritten, only re-parse if the content changed
+                manifest['sha256'] = self._hash_file(source)
+                if cached_manifest.get('sha256') == manifest['sha256']:
+                    status = 'hit'
+                    self._write_cache_manifest(manifest_file, manifest)
+
+        if status == 'miss':
+            metrics_df = self.read_csv_from_filepath(str(source), compact=compact)
+            manifest.setdefault('sha256', self._hash_file(source))
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated cache
+            tmp_file = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+            feather.write_feather(metrics_df, str(tmp_file), compression='uncompressed')
+            os.replace(tmp_file, cache_file)
+            self._write_cache_manifest(manifest_file, manifest)
+        else:
+            metrics_df = feather.read_table(str(cache_file), memory_map=True).to_pandas()
+
+        self.cache_stats[status] += 1
+        logger.info("Columnar cache %s for %s (%s)", status, source, cache_file)
+        return metrics_df
+
+    def _hash_file(self, file_location: Path) -> str:
+        """Returns the sha256 hex digest of a file, read in blocks of 1 MiB."""
+        digest = hashlib.sha256()
+        with open(file_location, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _read_cache_manifest(self, manifest_file: Path):
+        """Returns the manifest of a cache file, or None when it is missing or unreadable."""
+        try:
+            with open(manifest_file) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache_manifest(self, manifest_file: Path, manifest: dict):
+        """Writes the manifest of a cache file."""
+        with open(manifest_file, 'w') as file:
+            json.dump(manifest, file, indent=2)
+
+    @instrumentation.instrument(count_result=True)
+    def read_csv_from_filepath_in_chunks(self, file_location: str, chunksize: int = 100000, compact: bool = False) -> pd.DataFrame:
+        """Streams the csv file in chunks and pre-aggregates it per week, browser and country.
+
+        Every chunk is aggregated, and the chunk aggregates are folded into a running
+        aggregate once they hold as many rows as it does. The peak memory then depends
+        on the number of distinct (week, browser, country) segments rather than the
+        number of rows, and every row is regrouped a bounded number of times on
+        average, however many chunks the file has. Segments keep the order in which they first appear in the file, which
+        makes the aggregate a drop-in replacement for the raw DataFrame in every
+        analysis method.
+
+        Args:
+            file_location: Location of the file
+            chunksize: Number of rows parsed at a time
+            compact: convert the aggregate to schema.compact_metrics_schema
+
+        Returns:
+            A pandas DataFrame with the summed visits and conversions per segment
+        """
+        keys = [column for column in schema.metrics_schema if column not in ('visits', 'conversions')]
+
+        aggregate_df = None
+        partials = []
+        partial_rows = 0
+        for chunk in pd.read_csv(file_location, sep=',', dtype=self._read_dtypes(False), chunksize=chunksize):
+            partials.append(self._merge_aggregates([chunk], keys))
+            partial_rows += len(partials[-1])
+            if aggregate_df is None or partial_rows >= len(aggregate_df):
+                aggregate_df = self._merge_aggregates([aggregate_df, *partials], keys)
+                partials, partial_rows = [], 0
+        if partials:
+            aggregate_df = self._merge_aggregates([aggregate_df, *partials], keys)
+
+        return self._finish_aggregate(aggregate_df, compact)
+
+    @instrumentation.instrument(count_result=True)
+    def read_csv_from_filepaths(self, file_locations, workers: int = None, max_in_flight: int = None,
+                                processes: bool = True, compact: bool = False) -> pd.DataFrame:
+        """Reads many csv shards concurrently and pre-aggregates them per week, browser and country.
+
+        Each shard is parsed and aggregated in a worker. The shard aggregates are
+        folded, in the order of the shards, into a running aggregate once they hold as
+        many rows as it does, like the chunks of read_csv_from_filepath_in_chunks, so
+        the result is the same as reading the concatenated files with it. Compressed
+        shards (.gz, .bz2, .zip, ...) are decompressed based on their extension.
+
+        At most max_in_flight shards are either being parsed or waiting for an earlier
+        shard before being folded. With the buffered shard aggregates, which hold at
+        most as many rows as the running aggregate, the memory is bounded by the number
+        of segments rather than the number of shards.
+
+        Args:
+            file_locations: glob pattern, path, or list of paths and patterns
+            workers: number of workers, defaults to the number of cores
+            max_in_flight: maximum number of shards submitted to the workers and not
+                folded yet, defaults to twice the number of workers
+            processes: parse in a process pool, or in a thread pool when False
+            compact: convert the aggregate to schema.compact_metrics_schema
+
+        Returns:
+            A pandas DataFrame with the summed visits and conversions per segment
+        """
+        if isinstance(file_locations, (str, os.PathLike)):
+            file_locations = [file_locations]
+        shards = []
+        for file_location in map(str, file_locations):
+            matches = sorted(glob.glob(file_location))
+            if not matches:
+                raise FileNotFoundError(f"No csv file matches {file_location}")
+            shards.extend(matches)
+
+        workers = workers or os.cpu_count() or 1
+        max_in_flight = max(max_in_flight or 2 * workers, 1)
+        keys = [column for column in schema.metrics_schema if column not in ('visits', 'conversions')]
+        executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+
+        aggregate_df = None
+        # Shard aggregates in shard order not folded yet, and the ones parsed before an earlier shard
+        partials, partial_rows = [], 0
+        completed = {}
+        next_shard = next_fold = 0
+        with executor_class(max_workers=workers) as executor:
+            # Shard index of every submitted future
+            pending = {}
+            while next_shard < len(shards) or pending:
+                while next_shard < len(shards) and next_shard - next_fold < max_in_flight:
+                    pending[executor.submit(_read_shard, shards[next_shard], self._read_dtypes(False), keys)] = next_shard
+                    next_shard += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    completed[pending.pop(future)] = future.result()
+                while next_fold in completed:
+                    partials.append(completed.pop(next_fold))
+                    partial_rows += len(partials[-1])
+                    next_fold += 1
+                    if aggregate_df is None or partial_rows >= len(aggregate_df):
+                        aggregate_df = self._merge_aggregates([aggregate_df, *partials], keys)
+                        partials, partial_rows = [], 0
+        if partials:
+            aggregate_df = self._merge_aggregates([aggregate_df, *partials], keys)
+
+        return self._finish_aggregate(aggregate_df, compact)
+
+    def _merge_aggregates(self, frames: list, keys: list) -> pd.DataFrame:
+        """Sums the metrics of the frames per key, in order of first appearance. None frames are skipped."""
+        merged_df = pd.concat([frame for frame in frames if frame is not None], ignore_index=True)
+        metrics = ['visits', 'conversions', *(column for column in schema.optional_metrics_schema if column in merged_df.columns)]
+        return self._aggregate(merged_df, keys, metrics)
+
+    def _finish_aggregate(self, aggregate_df: pd.DataFrame, compact: bool) -> pd.DataFrame:
+        """Orders the columns of a pre-aggregated csv like the raw file, optionally in the compact schema."""
+        if aggregate_df is None:
+            aggregate_df = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in schema.metrics_schema.items()})
+        aggregate_df = aggregate_df[[*schema.metrics_schema, *(column for column in schema.optional_metrics_schema if column in aggregate_df.columns)]]
+        return schema.to_compact_dtypes(aggregate_df) if compact else aggregate_df
+
+    @instrumentation.instrument()
     def transform_data(self, metrics_df: pd.DataFrame) -> pd.DataFrame:
         """Reads the pandas Dataframe and calculate the weekly conversion rate
         across all the countries and browsers
@@ -34,8 +294,7 @@ class dataProcessing:
             A weekly aggregated Dataframe
         """
         # Calculate the total visits and total conversions for each week
-        weekly_aggregates_df = metrics_df.groupby([pd.Grouper(key='week')]).agg({'visits': 'sum', 'conversions': 'sum'})
-        weekly_aggregates_df = weekly_aggregates_df.reset_index()
+        weekly_aggregates_df = self._aggregate(metrics_df, ['week']).sort_values('week', ignore_index=True)
 
         # Rename the columns
         weekly_aggregates_df = weekly_aggregates_df.rename(
@@ -56,16 +315,22 @@ class dataProcessing:
 
         return weekly_aggregates_df
 
-    def decompose_and_calculate_effects_by_country(self, metrics_df: pd.DataFrame)  -> pd.DataFrame:
+    @instrumentation.instrument()
+    def decompose_and_calculate_effects_by_country(self, metrics_df: pd.DataFrame, engine: str = 'vectorized')  -> pd.DataFrame:
         """Reads the Dataframe and decomposes the week-on-week conversion rate 
         changes into rate and proportion changes per country.
 
         Args:
             metrics_df: Dataframe of the csv dataset
+            engine : 'vectorized' (default) or 'loop' for the reference implementation
 
         Returns:
             A DataFrame with the decomposition results for each country
         """
+        if engine != 'loop':
+            return self.decompose_and_calculate_effects_by_dimension(metrics_df, ['country'], engine=engine)
+
+        metrics_df = self._as_frame(metrics_df)
         results = []
 
         # Get unique weeks
@@ -131,17 +396,23 @@ class dataProcessing:
             
         return combination
 
-    def decompose_and_calculate_effects_by_country_browser(self, metrics_df)-> pd.DataFrame:
+    @instrumentation.instrument()
+    def decompose_and_calculate_effects_by_country_browser(self, metrics_df, engine: str = 'vectorized')-> pd.DataFrame:
         """Reads the Dataframe and decomposes the week-on-week conversion rate 
         changes into rate and proportion changes per country and browser.
 
         Args:
             possibilitiesList : 
             metrics_df: Dataframe of the csv dataset
+            engine : 'vectorized' (default) or 'loop' for the reference implementation
 
         Returns:
             A DataFrame with the decomposition results for each country and browser
         """
+        if engine != 'loop':
+            return self.decompose_and_calculate_effects_by_dimension(metrics_df, ['country', 'browser'], engine=engine)
+
+        metrics_df = self._as_frame(metrics_df)
         results = []
 
         # Get unique weeks
@@ -195,17 +466,37 @@ class dataProcessing:
         results_df = pd.DataFrame(results)
         return results_df
 
-    def decompose_and_calculate_effects_by_dimension(self, metrics_df: pd.DataFrame, dimensions:list)-> pd.DataFrame:
+    @instrumentation.instrument()
+    def decompose_and_calculate_effects_by_dimension(self, metrics_df: pd.DataFrame, dimensions:list, engine: str = 'vectorized', sparse: bool = False, workers: int = None)-> pd.DataFrame:
         """Reads the Dataframe and decomposes the week-on-week conversion rate 
         changes into rate and proportion changes per dimension.
 
         Args:
             metrics_df: Dataframe of the csv dataset
             dimensions : parameter that you want to decompose the metric change with
+            engine : 'vectorized' (default) computes all week pairs with array operations,
+                'loop' runs the original row-by-row reference implementation
+            sparse : only emit the dimension combinations with visits in week_before or
+                week_after instead of the full cartesian product. The dimension columns
+                are then returned as categoricals. Only supported by the vectorized engine.
+            workers : split the week pairs across this many processes (see
+                parallel.decompose_in_parallel). Only supported by the vectorized engine.
 
         Returns:
             A DataFrame with the decomposition results for each dimension
         """
+        if engine == 'vectorized' and workers:
+            from .parallel import decompose_in_parallel
+            return decompose_in_parallel(self._as_frame(metrics_df), [dimensions], workers=workers, sparse=sparse,
+                                         effects_backend=self.effects_backend)[0]
+        if engine == 'vectorized':
+            return self._decompose_vectorized(metrics_df, dimensions, sparse)
+        if engine != 'loop':
+            raise ValueError(f"Unknown decomposition engine '{engine}', expected 'vectorized' or 'loop'")
+        if sparse or workers:
+            raise ValueError("Sparse mode and workers are only supported by the vectorized engine")
+
+        metrics_df = self._as_frame(metrics_df)
         results = []
 
         # Get unique weeks
@@ -230,9 +521,12 @@ class dataProcessing:
             for nextPossibility in range(total_possibilities):
                 combination = self.get_next_decomposition_combination(possibilitiesLists, nextPossibility)
                 # Extract data for each period
-                query_str = ' & '.join("{} == '{}'".format(dimensions[x], combination[x]) for x in range(len(dimensions)))
-                subset_before = metrics_df.query("{} & week == {}".format(query_str, week_before))
-                subset_after = metrics_df.query("{} & week == {}".format(query_str, week_after))
+                # A missing value is the only one not equal to itself
+                query_str = ' & '.join("{0} != {0}".format(dimensions[x]) if pd.isna(combination[x]) else "{} == '{}'".format(dimensions[x], combination[x])
+                                       for x in range(len(dimensions)))
+                with instrumentation.stage('query', rows=2 * len(metrics_df)):
+                    subset_before = metrics_df.query("{} & week == {}".format(query_str, week_before))
+                    subset_after = metrics_df.query("{} & week == {}".format(query_str, week_after))
                 
                 # Calculate conversion rates and proportions
                 rate_before = (subset_before['conversions'].sum() / 
@@ -262,6 +556,218 @@ class dataProcessing:
 
         return results_df
     
+    @instrumentation.instrument()
+    def build_cube(self, metrics_df: pd.DataFrame, dimensions: list = ('country', 'browser'), max_bytes: int = 256 * 2 ** 20) -> aggregateCube:
+        """Aggregates the csv dataset once at the (week, *dimensions) grain.
+
+        The cube can be passed to every analysis method instead of the raw DataFrame.
+        They then read their totals from its memoized rollups instead of grouping
+        the raw rows again.
+
+        Args:
+            metrics_df: Dataframe of the csv dataset
+            dimensions: dimension columns of the finest grain
+            max_bytes: memory budget of the memoized rollups
+
+        Returns:
+            An aggregateCube
+        """
+        return aggregateCube(metrics_df, dimensions, max_bytes)
+
+    def _as_frame(self, metrics_df) -> pd.DataFrame:
+        """Returns the rows of the finest grain of a cube, or the DataFrame itself."""
+        return metrics_df.frame if isinstance(metrics_df, aggregateCube) else metrics_df
+
+    @instrumentation.instrument()
+    def _aggregate(self, metrics_df: pd.DataFrame, keys: list, metrics: list = ('visits', 'conversions')) -> pd.DataFrame:
+        """Sums the metric columns per unique combination of the given keys.
+
+        Groups keep the order in which they first appear in the data, so the
+        dimension values come out in the same order as Series.unique(). Missing
+        dimension values form their own group, so their rows still count in the
+        totals. When metrics_df is an aggregateCube the memoized rollup is returned.
+
+        Args:
+            metrics_df: Dataframe of the csv dataset, or an aggregateCube
+            keys : columns to group upon
+            metrics : additive columns to sum, visits and conversions by default
+
+        Returns:
+            An aggregated DataFrame with the keys and metrics columns
+        """
+        metrics = list(metrics)
+        if isinstance(metrics_df, aggregateCube):
+            rollup_df = metrics_df.rollup(keys)
+            missing = [metric for metric in metrics if metric not in rollup_df.columns]
+            if missing:
+                raise ValueError(f"The cube does not hold the metrics {missing}")
+            return rollup_df[[*keys, *metrics]]
+        return metrics_df.groupby(keys, sort=False, observed=True, dropna=False)[metrics].sum().reset_index()
+
+    def _build_segment_matrices(self, metrics_df: pd.DataFrame, dimensions: list, sparse: bool = False, dimension_values: list = None,
+                                metrics: list = ('visits', 'conversions')):
+        """Pivots the (week, *dimensions) aggregate into week x segment matrices.
+
+        A segment is one combination of dimension values. Segments are numbered
+        in the same order as get_next_decomposition_combination enumerates them,
+        i.e. the cartesian product of the unique values with the last dimension
+        varying fastest. In sparse mode only the combinations observed in the
+        data get a column.
+
+        Args:
+            metrics_df: Dataframe of the csv dataset
+            dimensions : parameter that you want to decompose the metric change with
+            sparse : only keep the observed dimension combinations
+            dimension_values : unique values of each dimension, in segment order. Used
+                when metrics_df only holds part of the data, defaults to the values
+                found in metrics_df
+            metrics : additive columns to pivot
+
+        Returns:
+            A tuple of (sorted weeks, unique values per dimension, value codes per
+            dimension for every segment, {metric: week x segment matrix})
+        """
+        aggregated = self._aggregate(metrics_df, ['week', *dimensions], metrics)
+
+        week_codes, weeks = pd.factorize(aggregated['week'], sort=True)
+        dimension_codes = []
+        if dimension_values is None:
+            dimension_values = []
+            for dimension in dimensions:
+                codes, values = pd.factorize(aggregated[dimension], use_na_sentinel=False)
+                dimension_codes.append(codes)
+                dimension_values.append(values)
+        else:
+            dimension_values = [pd.Index(values) for values in dimension_values]
+            for dimension, values in zip(dimensions, dimension_values):
+                dimension_codes.append(values.get_indexer(aggregated[dimension]))
+
+        shape = tuple(len(values) for values in dimension_values)
+        combination_codes = np.ravel_multi_index(dimension_codes, shape) if dimensions else np.zeros(len(aggregated), dtype=np.intp)
+        if sparse:
+            # Number the observed combinations only, keeping the cartesian order
+            segment_codes, segments = pd.factorize(combination_codes, sort=True)
+        else:
+            segment_codes, segments = combination_codes, np.arange(int(np.prod(shape)))
+        segment_dimension_codes = np.unravel_index(segments, shape)
+
+        matrices = {}
+        for metric in metrics:
+            matrices[metric] = np.zeros((len(weeks), len(segments)), dtype=np.float64)
+            matrices[metric][week_codes, segment_codes] = aggregated[metric].to_numpy(dtype=np.float64)
+
+        return np.asarray(weeks), dimension_values, segment_dimension_codes, matrices
+
+    def _calculate_effects(self, numerator: np.ndarray, denominator: np.ndarray):
+        """Computes the rate and proportion change effects of every consecutive week pair.
+
+        Delegates to kernels.calculate_effects with the effects_backend of the object,
+        which also checks that the effects of every week pair add up to the change
+        of the overall rate.
+
+        Args:
+            numerator : week x segment matrix of the rate numerator, e.g. conversions
+            denominator : week x segment matrix of the rate denominator, e.g. visits
+
+        Returns:
+            A tuple of (rate change effect, proportion change effect) week pair x segment matrices
+        """
+        return kernels.calculate_effects(numerator, denominator, backend=self.effects_backend)
+
+    def _decompose_matrices(self, metrics_df: pd.DataFrame, dimensions: list, metric_pairs: list, sparse: bool = False,
+                            dimension_values: list = None, effect_names=None) -> pd.DataFrame:
+        """Groups the data once and decomposes every (numerator, denominator) pair on the shared matrices.
+
+        Args:
+            metrics_df: Dataframe of the csv dataset
+            dimensions : parameter that you want to decompose the metric change with
+            metric_pairs : list of (numerator, denominator) columns
+            sparse : only emit segments with a denominator in week_before or week_after
+            dimension_values : unique values of each dimension, see _build_segment_matrices
+            effect_names : function of (numerator, denominator) returning the names of the
+                rate and proportion change effect columns
+
+        Returns:
+            A DataFrame with the decomposition results for each dimension and metric
+        """
+        metrics = list(dict.fromkeys(column for pair in metric_pairs for column in pair))
+        weeks, dimension_values, segment_dimension_codes, matrices = self._build_segment_matrices(metrics_df, dimensions, sparse, dimension_values, metrics)
+        n_segments = len(segment_dimension_codes[0]) if dimensions else 1
+
+        if sparse:
+            # Keep the segments with a denominator in at least one of the two weeks
+            observed = np.zeros((max(len(weeks) - 1, 0), n_segments), dtype=bool)
+            for denominator in dict.fromkeys(denominator for _, denominator in metric_pairs):
+                observed |= (matrices[denominator][:-1] != 0) | (matrices[denominator][1:] != 0)
+            pair_index, segment_index = np.nonzero(observed)
+        else:
+            pair_index = np.repeat(np.arange(len(weeks) - 1), n_segments)
+            segment_index = np.tile(np.arange(n_segments), max(len(weeks) - 1, 0))
+
+        results = {}
+        for dimension, values, codes in zip(dimensions, dimension_values, segment_dimension_codes):
+            if sparse and values.hasnans:
+                # Categories cannot hold the missing value, which gets the -1 code
+                results[dimension] = pd.Categorical(np.asarray(values, dtype=object)[codes[segment_index]], categories=values.dropna())
+            elif sparse:
+                results[dimension] = pd.Categorical.from_codes(codes[segment_index], categories=values)
+            else:
+                results[dimension] = np.asarray(values, dtype=object)[codes[segment_index]]
+        results['week_before'] = weeks[pair_index]
+        results['week_after'] = weeks[pair_index + 1]
+        for numerator, denominator in metric_pairs:
+            rate_change, proportion_change = self._calculate_effects(matrices[numerator], matrices[denominator])
+            rate_name, proportion_name = effect_names(numerator, denominator)
+            results[rate_name] = rate_change[pair_index, segment_index]
+            results[proportion_name] = proportion_change[pair_index, segment_index]
+
+        return pd.DataFrame(results)
+
+    @instrumentation.instrument()
+    def _decompose_vectorized(self, metrics_df: pd.DataFrame, dimensions: list, sparse: bool = False, dimension_values: list = None) -> pd.DataFrame:
+        """Vectorized version of decompose_and_calculate_effects_by_dimension.
+
+        Aggregates the data once, then computes the effects of every consecutive
+        week pair as whole-array operations on the week x segment matrices.
+
+        Args:
+            metrics_df: Dataframe of the csv dataset
+            dimensions : parameter that you want to decompose the metric change with
+            sparse : only emit segments with visits in week_before or week_after
+            dimension_values : unique values of each dimension, see _build_segment_matrices
+
+        Returns:
+            A DataFrame with the decomposition results for each dimension
+        """
+        return self._decompose_matrices(metrics_df, dimensions, [('conversions', 'visits')], sparse, dimension_values,
+                                        lambda numerator, denominator: ('rate_change_effect', 'proportion_change_effect'))
+
+    @instrumentation.instrument()
+    def decompose_metrics_by_dimension(self, metrics_df: pd.DataFrame, dimensions: list, metric_pairs: list = None, sparse: bool = False) -> pd.DataFrame:
+        """Decomposes the week-on-week change of several ratio metrics in one pass.
+
+        The data is grouped once per (week, *dimensions) and all the numerator and
+        denominator columns are summed together. Each ratio is then decomposed into
+        a rate change effect and a proportion (mix) change effect, where the mix is
+        the segment's share of the ratio's denominator.
+
+        Args:
+            metrics_df: Dataframe of the csv dataset, or an aggregateCube
+            dimensions : parameter that you want to decompose the metric change with
+            metric_pairs : list of (numerator, denominator) columns, defaults to
+                schema.metric_pairs, e.g. [('conversions', 'visits'), ('revenue', 'visits')]
+            sparse : only emit segments with a denominator in week_before or week_after
+
+        Returns:
+            A DataFrame with the dimensions, week_before, week_after and, for every pair,
+            the <numerator>_per_<denominator>_rate_change_effect and
+            <numerator>_per_<denominator>_proportion_change_effect columns
+        """
+        metric_pairs = [tuple(pair) for pair in (metric_pairs or schema.metric_pairs)]
+        return self._decompose_matrices(metrics_df, dimensions, metric_pairs, sparse,
+                                        effect_names=lambda numerator, denominator: schema.effect_columns(numerator, denominator))
+
+    @instrumentation.instrument()
     def analyze_decomposition_by_dimension(self, results_df: pd.DataFrame, dimension:list):
         """
         This function helps us to identify and visualise the 
@@ -271,27 +777,65 @@ class dataProcessing:
             results_df : decomposed Dataframe
             dimension : parameter on which we want to analyze the decomposition
         Returns:
-            A visual representation of top rate and porportion contributors based on the dimension
+            A visual representation of top rate and porportion contributors based on the dimension,
+            and the (top rate contributors, top proportion contributors) DataFrames
         """
-        # Sort by contribution
-        sorted_rate_change = results_df.sort_values(by='rate_change_effect', ascending=False)
-        sorted_proportion_change = results_df.sort_values(by='proportion_change_effect', ascending=False)
-
         # Visualize top contributors
-        top_rate_contributors = sorted_rate_change.head(10)
-        top_proportion_contributors = sorted_proportion_change.head(10)
-        
-        dim_name = dimension
+        top_rate_contributors = self.top_contributors(results_df, 'rate_change_effect', k=10, dimension=dimension)
+        top_proportion_contributors = self.top_contributors(results_df, 'proportion_change_effect', k=10, dimension=dimension)
+
         # Conatenate dimensions to use as a header of x-axis
-        if isinstance(dimension, list):
-            dim_name = ' - '.join(dimension)
-            top_rate_contributors[dim_name] = top_rate_contributors[dimension].apply(lambda x: ' - '.join(x.astype(str)), axis=1)
-            top_proportion_contributors[dim_name] = top_proportion_contributors[dimension].apply(lambda x: ' - '.join(x.astype(str)), axis=1)
+        dim_name = ' - '.join(dimension) if isinstance(dimension, list) else dimension
 
         # Plot the top rate change and proportion change contributors
         self.plot_metrics(top_rate_contributors, dim_name , 'rate_change_effect')
         self.plot_metrics(top_proportion_contributors, dim_name, 'proportion_change_effect')
-        
+
+        return top_rate_contributors, top_proportion_contributors
+
+    @instrumentation.instrument()
+    def top_contributors(self, results_df: pd.DataFrame, effect: str, k: int = 10, dimension=None,
+                         per_week_pair: bool = False, by_magnitude: bool = False) -> pd.DataFrame:
+        """Selects the k decomposition rows with the largest effect without sorting all rows.
+
+        Args:
+            results_df : decomposed Dataframe
+            effect : 'rate_change_effect' or 'proportion_change_effect'
+            k : number of contributors to return
+            dimension : list of dimensions to concatenate into a ' - ' separated label
+                column, named after the joined dimension names
+            per_week_pair : select the top k of every (week_before, week_after) pair
+                instead of the top k overall
+            by_magnitude : rank by the absolute effect, so the largest negative
+                contributors are included
+
+        Returns:
+            The selected rows, ordered by decreasing effect (per week pair when per_week_pair is set)
+        """
+        values = results_df[effect].to_numpy(dtype=np.float64)
+        ranking = np.abs(values) if by_magnitude else values
+
+        if per_week_pair:
+            ranked = pd.Series(ranking, index=pd.RangeIndex(len(results_df)))
+            selected = ranked.groupby([results_df['week_before'].to_numpy(), results_df['week_after'].to_numpy()], sort=True).nlargest(k)
+            positions = selected.index.get_level_values(-1).to_numpy()
+        else:
+            # Partial selection of the k largest, NaN are ranked last like sort_values does
+            order_key = np.where(np.isnan(ranking), np.inf, -ranking)
+            positions = np.arange(len(ranking))
+            if k < len(ranking):
+                positions = np.argpartition(order_key, k - 1)[:k] if k > 0 else positions[:0]
+            positions = positions[np.lexsort((positions, order_key[positions]))]
+
+        top_df = results_df.iloc[positions]
+        if isinstance(dimension, list) and dimension:
+            labels = top_df[dimension[0]].astype(str)
+            if len(dimension) > 1:
+                labels = labels.str.cat([top_df[column].astype(str) for column in dimension[1:]], sep=' - ')
+            top_df = top_df.assign(**{' - '.join(dimension): labels})
+        return top_df
+
+    @instrumentation.instrument()
     def analyze_metrics_per_country(self, data:pd.DataFrame):
         """
         This functions helps us to analyze the metrics per country.
@@ -303,13 +847,13 @@ class dataProcessing:
 
         groupByColumns = ['week', 'country']
 
-        # Calculate the aggregates by week and country
-        data = data.groupby(groupByColumns).agg({'visits': 'sum', 'conversions': 'sum'}).reset_index()
-
         # Calculate the total visits by week
-        total_visits_df = data.groupby(['week']).agg({'visits': 'sum'}).reset_index()
+        total_visits_df = self._aggregate(data, ['week'])[['week', 'visits']]
         total_visits_df = total_visits_df.rename(columns= {'visits': 'global_visits'})
 
+        # Calculate the aggregates by week and country
+        data = self._aggregate(data, groupByColumns).sort_values(groupByColumns, ignore_index=True)
+
         # Merge the two datasets for calculating the conversion rate by country
         merged_df = pd.merge(data, total_visits_df, on='week')
         merged_df['conversion_rate'] = merged_df['conversions'] / merged_df['global_visits']
@@ -322,9 +866,12 @@ class dataProcessing:
 
         return merged_df
     
+    @instrumentation.instrument()
     def plot_metrics(self, df: pd.DataFrame, x_col, y_col, group_by_col=None, add_locator=False):
         """
-        This functions plot dynamically based on the x-axis, y-axis and group_by_col
+        This functions plot dynamically based on the x-axis, y-axis and group_by_col.
+        Depending on the plotting options of the object, the chart is skipped, shown
+        in a window, or written to plot_dir (in a worker process when plot_workers is set).
         Args:
             x_col : x-axis column
             y_col : y-axis column
@@ -333,80 +880,33 @@ class dataProcessing:
         Returns:
             A visual representation
         """
-        plt.figure(figsize=(12, 6))
-        plt.rcParams["font.weight"] = "bold"
-        plt.rcParams["axes.labelweight"] = "bold"
-        plt.gca().ticklabel_format(axis='y', style='plain')
-
-        # Initialize max_value for dynamic y-axis limit
-        max_value = 0  
-       
-        # Determine the data type of x_col
-        if pd.api.types.is_numeric_dtype(df[x_col]):
-            is_numeric_x = True
-        else:
-            is_numeric_x = False
-
-        if group_by_col:
-            # Group the data by the specified column
-            for label, row in df.groupby(group_by_col):
-                if is_numeric_x:
-                    # Plot the line chart for numeric type x-axis column
-                    plt.plot(row[x_col], row[y_col], marker='o', linestyle='-', label=label)
-                else:
-                    # Plot the bar chart for numeric type x-axis column
-                    plt.bar(row[x_col].astype(str), row[y_col], label=label)
-
-                # Update the max value as per the max value of y-axis column
-                max_value = max(max_value, row[y_col].max())  
-            plt.legend(title=group_by_col.title())
+        if not self.plot:
+            return
+        # Imported here so computing the DataFrames never pays for loading matplotlib
+        from . import plotting
+
+        if self.plot_dir is None:
+            plotting.show_metrics(df, x_col, y_col, group_by_col, add_locator)
+            return
+
+        os.makedirs(self.plot_dir, exist_ok=True)
+        output_file = os.path.join(self.plot_dir, plotting.chart_file_name(len(self._plot_jobs), x_col, y_col, group_by_col, self.plot_format))
+        if self.plot_workers:
+            if self._plot_executor is None:
+                self._plot_executor = ProcessPoolExecutor(max_workers=self.plot_workers)
+            self._plot_jobs.append(self._plot_executor.submit(plotting.save_metrics, df, x_col, y_col, group_by_col, add_locator, output_file))
         else:
-            # Plot data without grouping
-            if is_numeric_x:
-                plt.plot(df[x_col], df[y_col], marker='o', linestyle='-')
-            else:
-                plt.bar(df[x_col].astype(str), df[y_col])
-            max_value = df[y_col].max()
+            self._plot_jobs.append(plotting.save_metrics(df, x_col, y_col, group_by_col, add_locator, output_file))
 
-        # Handle x-axis label formatting
-        if not is_numeric_x or isinstance(df[x_col].iloc[0], list):
-            plt.xticks(df[x_col].apply(lambda x: ', '.join(x) if isinstance(x, list) else str(x)), rotation=45, ha='right')
-        else:
-            plt.xticks(df[x_col])
-
-        plt.title(f'{y_col.replace("_", " ").title()} Over {x_col.replace("_", " ").title()}' + (f' by {group_by_col.title()}' if group_by_col else ''))
-        plt.xlabel(x_col.replace("_", " ").title())
-        plt.ylabel(y_col.replace("_", " ").title())
-
-        # Apply comma formatting to the y-axis
-        def comma_format(x:int, pos):
-            """
-            This functions adds commas to the y-axis numbers
-            Args:
-                x : a number
-            Returns:
-                a formatted number with commas
-            """
-            if x == 0:
-                return "0"
-            elif x % 1 == 0:
-                # Format as int with commas
-                return f'{int(x):,}' 
-            else:
-                # Format as float with commas, two decimal places
-                return f'{x:,.6f}'  
-            
-        ax = plt.gca()
-        ax.yaxis.set_major_formatter(FuncFormatter(comma_format))  
-        if add_locator:
-            ax.yaxis.set_minor_locator(MultipleLocator(250000))
-            # Set major ticks with 500,000 increments for the whole range
-            ax.yaxis.set_major_locator(MultipleLocator(250000))
-        if is_numeric_x:
-            # Only show gridlines for line charts (numeric x-axis)
-            plt.grid(True)  
-        else:
-            plt.grid(False)
+    def wait_for_plots(self) -> list:
+        """Waits for the charts rendered in worker processes and shuts the workers down.
 
-        plt.tight_layout()
-        plt.show()
+        Returns:
+            The paths of the charts written to plot_dir so far
+        """
+        paths = [job.result() if isinstance(job, Future) else job for job in self._plot_jobs]
+        if self._plot_executor is not None:
+            self._plot_executor.shutdown()
+            self._plot_executor = None
+        self._plot_jobs = paths
+        return paths
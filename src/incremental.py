@@ -0,0 +1,69 @@
+"""
+Incremental week-on-week decomposition for data that arrives one week at a time
+"""
+import pickle
+import pandas as pd
+from .data_processing import dataProcessing
+
+
+class incrementalDecomposition:
+    """Keeps the per-week segment totals and the decomposition rows computed so far.
+
+    Ingesting a new week only decomposes the (last week, new week) pair and appends
+    the rows, so a weekly refresh does not depend on the length of the history.
+    Each pair is decomposed in sparse mode: only the segments visited in one of the
+    two weeks are emitted, because the set of dimension values can grow over time.
+    """
+
+    def __init__(self, dimensions: list):
+        self.dimensions = list(dimensions)
+        # Summed visits and conversions per segment, keyed by week
+        self.week_totals = {}
+        self.results = []
+
+    @property
+    def weeks(self) -> list:
+        return sorted(self.week_totals)
+
+    def add_week(self, metrics_df: pd.DataFrame) -> pd.DataFrame:
+        """Ingests the rows of one or more new weeks and decomposes the new week pairs.
+
+        Args:
+            metrics_df: rows of weeks that come after every week ingested so far
+
+        Returns:
+            A DataFrame with the decomposition rows added by this call
+        """
+        processor = dataProcessing()
+        new_weeks = sorted(metrics_df['week'].unique())
+        if self.week_totals and new_weeks and new_weeks[0] <= self.weeks[-1]:
+            raise ValueError(f"Week {new_weeks[0]} is not after the last ingested week {self.weeks[-1]}")
+
+        added = []
+        for week in new_weeks:
+            week_df = processor._aggregate(metrics_df.loc[metrics_df['week'] == week], ['week', *self.dimensions])
+            if self.week_totals:
+                pair_df = pd.concat([self.week_totals[self.weeks[-1]], week_df], ignore_index=True)
+                pair_results = processor.decompose_and_calculate_effects_by_dimension(pair_df, self.dimensions, sparse=True)
+                # Categories differ between pairs, so store the dimension values as plain objects
+                pair_results = pair_results.astype({dimension: object for dimension in self.dimensions})
+                self.results.append(pair_results)
+                added.append(pair_results)
+            self.week_totals[week] = week_df
+
+        return pd.concat(added, ignore_index=True) if added else pd.DataFrame()
+
+    def results_df(self) -> pd.DataFrame:
+        """Returns every decomposition row computed so far."""
+        return pd.concat(self.results, ignore_index=True) if self.results else pd.DataFrame()
+
+    def save(self, file_location: str):
+        """Persists the state to the specified path."""
+        with open(file_location, 'wb') as file:
+            pickle.dump(self, file)
+
+    @staticmethod
+    def load(file_location: str) -> 'incrementalDecomposition':
+        """Loads a state persisted with save."""
+        with open(file_location, 'rb') as file:
+            return pickle.load(file)
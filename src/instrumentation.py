@@ -0,0 +1,178 @@
+"""
+Per-stage instrumentation of the pipeline: wall time, rows processed, peak memory and call counts
+
+Instrumentation is off by default. While off, an instrumented call costs a single flag
+check. Stages nest, e.g. the query() calls inside decompose_and_calculate_effects_by_dimension
+are reported as their own stage and also count towards the enclosing one.
+"""
+import cProfile
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+from .cube import aggregateCube
+
+
+class _instrumentationState:
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        # Whether tracemalloc was started by enable, and has to be stopped by disable
+        self.started_tracing = False
+        self.profiler = None
+        self.stages = {}
+        # Peak memory of the finished child stages of every running stage
+        self.child_peaks = []
+
+
+_state = _instrumentationState()
+
+
+def enable(trace_memory: bool = True, profile: bool = False):
+    """Starts recording the instrumented stages.
+
+    Args:
+        trace_memory: measure the peak memory of every stage with tracemalloc, which
+            slows down allocation heavy code
+        profile: also run cProfile, see dump_profile
+    """
+    _state.enabled = True
+    _state.trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state.started_tracing = True
+    if profile:
+        _state.profiler = cProfile.Profile()
+        _state.profiler.enable()
+
+
+def disable():
+    """Stops recording. The recorded stages are kept until reset."""
+    _state.enabled = False
+    if _state.started_tracing:
+        tracemalloc.stop()
+        _state.started_tracing = False
+    _state.trace_memory = False
+    if _state.profiler is not None:
+        _state.profiler.disable()
+
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+
+def reset():
+    """Forgets the recorded stages and the profile."""
+    _state.stages = {}
+    _state.child_peaks = []
+    _state.profiler = None
+
+
+def _count_rows(args) -> int:
+    """Returns the number of rows of the first DataFrame or aggregateCube argument, if any."""
+    for arg in args:
+        if isinstance(arg, (pd.DataFrame, aggregateCube)):
+            return len(arg)
+    return 0
+
+
+@contextmanager
+def _record(name: str, rows: int):
+    """Records the enclosed block. It yields a dict whose 'rows' can be updated before the block exits."""
+    if _state.trace_memory:
+        if _state.child_peaks:
+            # Keep the peak the enclosing stage reached so far, before resetting it
+            _state.child_peaks[-1] = max(_state.child_peaks[-1], tracemalloc.get_traced_memory()[1])
+        _state.child_peaks.append(0)
+        tracemalloc.reset_peak()
+    counts = {'rows': rows}
+    start = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if _state.trace_memory and _state.child_peaks:
+            peak = max(tracemalloc.get_traced_memory()[1], _state.child_peaks.pop())
+            if _state.child_peaks:
+                _state.child_peaks[-1] = max(_state.child_peaks[-1], peak)
+            tracemalloc.reset_peak()
+
+        stage = _state.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_bytes': 0})
+        stage['calls'] += 1
+        stage['seconds'] += elapsed
+        stage['rows'] += counts['rows']
+        stage['peak_bytes'] = max(stage['peak_bytes'], peak)
+
+
+@contextmanager
+def stage(name: str, rows: int = 0):
+    """Records the enclosed block as a stage when instrumentation is enabled."""
+    if not _state.enabled:
+        yield
+        return
+    with _record(name, rows):
+        yield
+
+
+def instrument(name: str = None, count_result: bool = False):
+    """Decorator recording every call of the function as a stage.
+
+    Args:
+        name: stage name, defaults to the function name. The rows of a call are the
+            rows of its first DataFrame or aggregateCube argument.
+        count_result: count the rows of the returned DataFrame instead, e.g. for the
+            csv readers, which take no DataFrame argument
+    """
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return function(*args, **kwargs)
+            with _record(stage_name, 0 if count_result else _count_rows(args)) as counts:
+                result = function(*args, **kwargs)
+                if count_result:
+                    counts['rows'] = _count_rows([result])
+                return result
+        return wrapper
+    return decorator
+
+
+def report() -> pd.DataFrame:
+    """Returns one row per stage with its calls, total and mean seconds, rows and peak memory."""
+    report_df = pd.DataFrame(
+        [{'stage': name, **stats} for name, stats in _state.stages.items()],
+        columns=['stage', 'calls', 'seconds', 'rows', 'peak_bytes'])
+    report_df['mean_seconds'] = report_df['seconds'] / report_df['calls']
+    return report_df.sort_values('seconds', ascending=False, ignore_index=True)
+
+
+def export_report(file_location: str):
+    """Writes the report as JSON, or as CSV when the file name ends with .csv."""
+    report_df = report()
+    if str(file_location).endswith('.csv'):
+        report_df.to_csv(file_location, index=False)
+    else:
+        with open(file_location, 'w') as file:
+            json.dump(report_df.to_dict(orient='records'), file, indent=2)
+
+
+def dump_profile(file_location: str):
+    """Writes the cProfile statistics, readable with pstats or snakeviz."""
+    if _state.profiler is None:
+        raise ValueError("No profile was recorded, enable the instrumentation with profile=True")
+    _state.profiler.dump_stats(file_location)
+
+
+def summary_table() -> str:
+    """Returns the report as a text table."""
+    report_df = report()
+    if report_df.empty:
+        return 'No instrumented stage was recorded'
+    report_df['peak_mb'] = report_df.pop('peak_bytes') / 2 ** 20
+    return report_df.to_string(index=False, float_format=lambda value: f'{value:,.4f}')
@@ -0,0 +1,175 @@
+"""
+Kernel of the Oaxaca-style decomposition: rate and proportion change effects of every segment
+
+The effects of all the consecutive period pairs are computed on contiguous float64
+period x segment arrays, with numpy by default or with numba on request. numba is
+only imported, and the kernel compiled, on the first call with backend='numba', so
+importing the package stays fast. Without numba, that backend falls back to numpy.
+"""
+import warnings
+import numpy as np
+
+"""
+Backend used when calculate_effects is called without one
+"""
+BACKEND = 'numpy'
+
+"""
+Backends accepted by calculate_effects
+"""
+BACKENDS = ('numpy', 'numba')
+
+
+def _effects_loop(numerator: np.ndarray, denominator: np.ndarray, rate_change: np.ndarray, proportion_change: np.ndarray):
+    """Fills the effect arrays of every consecutive period pair, one segment at a time.
+
+    Compiled by the numba backend, see calculate_effects for the formulas.
+    """
+    n_periods, n_segments = denominator.shape
+    for period in range(1, n_periods):
+        total_before = 0.0
+        total_after = 0.0
+        for segment in range(n_segments):
+            total_before += denominator[period - 1, segment]
+            total_after += denominator[period, segment]
+        for segment in range(n_segments):
+            visits_before = denominator[period - 1, segment]
+            visits_after = denominator[period, segment]
+            rate_before = numerator[period - 1, segment] / visits_before if visits_before != 0 else 0.0
+            rate_after = numerator[period, segment] / visits_after if visits_after != 0 else 0.0
+            proportion_before = visits_before / total_before if total_before != 0 else np.nan
+            proportion_after = visits_after / total_after if total_after != 0 else np.nan
+            rate_change[period - 1, segment] = proportion_after * (rate_after - rate_before)
+            proportion_change[period - 1, segment] = rate_before * (proportion_after - proportion_before)
+
+
+_effects_loop_compiled = None
+_numba_missing = False
+
+
+def _compiled_effects_loop():
+    """Returns _effects_loop compiled with numba, importing numba on the first call.
+
+    Returns None when numba is not installed, after warning once.
+    """
+    global _effects_loop_compiled, _numba_missing
+    if _effects_loop_compiled is None and not _numba_missing:
+        try:
+            import numba
+        except ImportError:
+            _numba_missing = True
+            warnings.warn("numba is not installed, the numba backend falls back to numpy", RuntimeWarning, stacklevel=3)
+            return None
+        _effects_loop_compiled = numba.njit(cache=True)(_effects_loop)
+    return _effects_loop_compiled
+
+
+def validate_backend(backend: str):
+    """Raises a ValueError when backend is neither None nor one of BACKENDS."""
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {', '.join(BACKENDS)}")
+
+
+def _effects_numpy(numerator: np.ndarray, denominator: np.ndarray):
+    """Whole-array version of _effects_loop."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Rate of each segment, zero when the segment has no denominator
+        rate = np.where(denominator != 0, numerator / np.where(denominator != 0, denominator, 1), 0.0)
+        # Share of the period denominator of each segment
+        proportion = denominator / denominator.sum(axis=1, keepdims=True)
+
+    rate_change = proportion[1:] * (rate[1:] - rate[:-1])
+    proportion_change = rate[:-1] * (proportion[1:] - proportion[:-1])
+    return rate_change, proportion_change
+
+
+def check_effect_sums(numerator: np.ndarray, denominator: np.ndarray, rate_change: np.ndarray, proportion_change: np.ndarray,
+                      tolerance: float = 1e-9) -> np.ndarray:
+    """Verifies that the effects of every period pair add up to the change of the overall rate.
+
+    The overall rate, sum(numerator) / sum(denominator), is sum(proportion * rate)
+    so its change splits exactly into proportion_after * rate change +
+    rate_before * proportion change. The interaction term, proportion change *
+    rate change, is part of the rate change effect because it is weighted by
+    proportion_after. The residual of every pair is therefore only the floating
+    point error.
+
+    The exception is the numerator of segments without a denominator, e.g.
+    revenue without conversions: their rate is zero, so no effect accounts for
+    it. That part of the overall rate change is reported with a RuntimeWarning,
+    and only the rest of the residual has to be within the tolerance.
+
+    Args:
+        numerator : period x segment array of the rate numerator, e.g. conversions
+        denominator : period x segment array of the rate denominator, e.g. visits
+        rate_change : period pair x segment rate change effects
+        proportion_change : period pair x segment proportion change effects
+        tolerance : largest residual accepted, relative to the largest overall rate
+            when it is above 1
+
+    Returns:
+        The residual of every period pair against the overall rate, NaN for the
+        pairs with an empty period
+
+    Raises:
+        ArithmeticError: when a residual exceeds the tolerance
+    """
+    totals = denominator.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overall_rate = numerator.sum(axis=1) / totals
+        # Part of the overall rate coming from segments without a denominator
+        unattributed_rate = np.where(denominator == 0, numerator, 0.0).sum(axis=1) / totals
+    empty = (totals[1:] == 0) | (totals[:-1] == 0)
+    residual = (overall_rate[1:] - overall_rate[:-1]) - (rate_change.sum(axis=1) + proportion_change.sum(axis=1))
+    residual[empty] = np.nan
+    unattributed = unattributed_rate[1:] - unattributed_rate[:-1]
+    unattributed[empty] = np.nan
+
+    # The tolerance is relative for rates above 1, e.g. revenue per visit
+    scale = np.nanmax(np.abs(overall_rate), initial=1.0)
+    worst = np.nanmax(np.abs(residual - unattributed), initial=0.0)
+    if worst > tolerance * scale:
+        raise ArithmeticError(f"The effects do not add up to the overall rate change, residual of {worst:.3e} above {tolerance:.1e}")
+    worst_unattributed = np.nanmax(np.abs(unattributed), initial=0.0)
+    if worst_unattributed > tolerance * scale:
+        warnings.warn(f"Segments without a denominator change the overall rate by up to {worst_unattributed:.3e}, "
+                      f"which no effect accounts for", RuntimeWarning, stacklevel=2)
+    return residual
+
+
+def calculate_effects(numerator: np.ndarray, denominator: np.ndarray, backend: str = None, check: bool = True,
+                      tolerance: float = 1e-9):
+    """Computes the rate and proportion change effects of every consecutive period pair.
+
+    For a segment with rate r = numerator / denominator (zero when the denominator
+    is zero) and proportion p = denominator / period total:
+        rate change effect = p_after * (r_after - r_before)
+        proportion change effect = r_before * (p_after - p_before)
+
+    Args:
+        numerator : period x segment array of the rate numerator, e.g. conversions
+        denominator : period x segment array of the rate denominator, e.g. visits
+        backend : 'numpy' or 'numba', defaults to BACKEND. 'numba' falls back to
+            numpy, with a warning on the first call, when numba is not installed
+        check : verify the effects with check_effect_sums
+        tolerance : largest residual accepted by the check
+
+    Returns:
+        A tuple of (rate change effect, proportion change effect) period pair x segment arrays
+    """
+    validate_backend(backend)
+    backend = backend or BACKEND
+    numerator = np.ascontiguousarray(numerator, dtype=np.float64)
+    denominator = np.ascontiguousarray(denominator, dtype=np.float64)
+
+    effects_loop = _compiled_effects_loop() if backend == 'numba' else None
+    if effects_loop is not None:
+        shape = (max(denominator.shape[0] - 1, 0), denominator.shape[1])
+        rate_change, proportion_change = np.empty(shape), np.empty(shape)
+        effects_loop(numerator, denominator, rate_change, proportion_change)
+    else:
+        rate_change, proportion_change = _effects_numpy(numerator, denominator)
+
+    if check:
+        check_effect_sums(numerator, denominator, rate_change, proportion_change, tolerance)
+    return rate_change, proportion_change
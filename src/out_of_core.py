@@ -0,0 +1,153 @@
+"""
+Out-of-core decomposition for datasets larger than memory
+
+The csv files are streamed once and split into one partition file per week. The
+decomposition then walks the consecutive week pairs with only two partitions in
+memory, and appends the rows of every pair to the output file.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from . import schema
+from .data_processing import dataProcessing
+
+MANIFEST_FILE = 'manifest.json'
+
+# The raw csv files are parsed like read_csv_from_filepath, so codes such as NA become
+# missing values. The files written here store a missing value as an empty field,
+# and only empty fields are read back as missing.
+WRITTEN_NA_OPTIONS = {'keep_default_na': False, 'na_values': ['']}
+
+
+def _partition_file(partition_dir: str, week) -> str:
+    return os.path.join(partition_dir, f'week={week}.csv')
+
+
+def partition_by_week(file_locations, partition_dir: str, dimensions: list = ('country', 'browser'), chunksize: int = 100000) -> dict:
+    """Streams the csv files and writes the rows of every week to its own partition file.
+
+    Each chunk is pre-aggregated per (week, *dimensions) before being appended, so the
+    partitions only hold segment sums. The unique values of every dimension are
+    recorded in the order they first appear, the same order the in-memory engines use.
+    Missing values are kept as a segment of their own, recorded as null in the manifest.
+
+    Args:
+        file_locations: path or list of paths of the csv files
+        partition_dir: directory of the partition files, created if needed
+        dimensions: dimension columns to keep
+        chunksize: Number of rows parsed at a time
+
+    Returns:
+        The manifest of the partitions, also written to partition_dir
+    """
+    if isinstance(file_locations, (str, os.PathLike)):
+        file_locations = [file_locations]
+    dimensions = list(dimensions)
+    os.makedirs(partition_dir, exist_ok=True)
+    # Partitions are appended to, so drop the ones of a previous run
+    for file_name in os.listdir(partition_dir):
+        if file_name.startswith('week=') and file_name.endswith('.csv'):
+            os.remove(os.path.join(partition_dir, file_name))
+
+    processor = dataProcessing(plot=False)
+    dtypes = {**schema.metrics_schema, **{dimension: 'str' for dimension in dimensions}}
+    weeks = set()
+    dimension_values = {dimension: {} for dimension in dimensions}
+    for file_location in file_locations:
+        for chunk in pd.read_csv(file_location, sep=',', dtype=dtypes, chunksize=chunksize):
+            for dimension in dimensions:
+                dimension_values[dimension].update(dict.fromkeys(None if pd.isna(value) else value for value in chunk[dimension].unique()))
+            chunk_df = processor._aggregate(chunk, ['week', *dimensions])
+            for week, week_df in chunk_df.groupby('week', sort=False):
+                week_df.to_csv(_partition_file(partition_dir, week), mode='a', header=week not in weeks, index=False)
+                weeks.add(week)
+
+    manifest = {
+        'dimensions': dimensions,
+        'weeks': sorted(int(week) for week in weeks),
+        'dimension_values': {dimension: list(values) for dimension, values in dimension_values.items()}
+    }
+    with open(os.path.join(partition_dir, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file, indent=2, allow_nan=False)
+    return manifest
+
+
+def read_manifest(partition_dir: str) -> dict:
+    """Loads the manifest of the partitions, with the missing dimension values as NaN."""
+    with open(os.path.join(partition_dir, MANIFEST_FILE)) as file:
+        manifest = json.load(file)
+    manifest['dimension_values'] = {dimension: [np.nan if value is None else value for value in values]
+                                    for dimension, values in manifest['dimension_values'].items()}
+    return manifest
+
+
+def read_partition(partition_dir: str, week, dimensions: list) -> pd.DataFrame:
+    """Loads the segment sums of one week."""
+    dtypes = {**schema.metrics_schema, **{dimension: 'str' for dimension in dimensions}}
+    return pd.read_csv(_partition_file(partition_dir, week), dtype=dtypes, **WRITTEN_NA_OPTIONS)
+
+
+def decompose_out_of_core(partition_dir: str, dimensions: list, output_file: str, sparse: bool = False) -> int:
+    """Decomposes the week-on-week conversion rate changes one week pair at a time.
+
+    Args:
+        partition_dir: directory written by partition_by_week
+        dimensions : parameter that you want to decompose the metric change with, a
+            subset of the partitioned dimensions
+        output_file: csv file the decomposition rows are written to
+        sparse : only emit segments with visits in week_before or week_after
+
+    Returns:
+        The number of rows written, which read_results loads identically to the
+        output of decompose_and_calculate_effects_by_dimension
+    """
+    manifest = read_manifest(partition_dir)
+    dimensions = list(dimensions)
+    missing = [dimension for dimension in dimensions if dimension not in manifest['dimensions']]
+    if missing:
+        raise ValueError(f"Dimensions {missing} were not partitioned, available: {manifest['dimensions']}")
+
+    processor = dataProcessing(plot=False)
+    dimension_values = [manifest['dimension_values'][dimension] for dimension in dimensions]
+    weeks = manifest['weeks']
+
+    written = 0
+    with open(output_file, 'w', newline='') as file:
+        # The header is written even when there is no week pair
+        pd.DataFrame(columns=[*dimensions, 'week_before', 'week_after', 'rate_change_effect', 'proportion_change_effect']).to_csv(file, index=False)
+        previous_df = read_partition(partition_dir, weeks[0], manifest['dimensions']) if weeks else None
+        for week in weeks[1:]:
+            current_df = read_partition(partition_dir, week, manifest['dimensions'])
+            pair_df = pd.concat([previous_df, current_df], ignore_index=True)
+            results_df = processor._decompose_vectorized(pair_df, dimensions, sparse, dimension_values)
+            results_df.to_csv(file, header=False, index=False)
+            written += len(results_df)
+            previous_df = current_df
+    return written
+
+
+def weekly_aggregates_out_of_core(partition_dir: str, processor: dataProcessing = None) -> pd.DataFrame:
+    """Computes the weekly conversion rate of transform_data one partition at a time.
+
+    Args:
+        partition_dir: directory written by partition_by_week
+        processor: dataProcessing used for transform_data, so its plotting options
+            apply. Defaults to one without plotting.
+
+    Returns:
+        The weekly aggregated Dataframe of transform_data
+    """
+    manifest = read_manifest(partition_dir)
+    processor = processor or dataProcessing(plot=False)
+    weekly_df = pd.concat(
+        [processor._aggregate(read_partition(partition_dir, week, manifest['dimensions']), ['week']) for week in manifest['weeks']],
+        ignore_index=True)
+    return processor.transform_data(weekly_df)
+
+
+def read_results(output_file: str, dimensions: list) -> pd.DataFrame:
+    """Loads the output of decompose_out_of_core with the dtypes of the in-memory results."""
+    dtypes = {dimension: object for dimension in dimensions}
+    dtypes.update({'week_before': 'int64', 'week_after': 'int64', 'rate_change_effect': 'float64', 'proportion_change_effect': 'float64'})
+    return pd.read_csv(output_file, dtype=dtypes, float_precision='round_trip', **WRITTEN_NA_OPTIONS)
@@ -0,0 +1,132 @@
+"""
+Parallel decomposition across a process pool, sharing the input through shared memory
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from .data_processing import dataProcessing
+
+
+def _to_shared_memory(values: np.ndarray, blocks: list) -> tuple:
+    """Copies an array into a new shared memory block.
+
+    Args:
+        values: array to share
+        blocks: list collecting the created blocks, so the caller can release them
+
+    Returns:
+        A (block name, dtype, length) tuple that workers use to attach to the array
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    blocks.append(block)
+    np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+    return block.name, values.dtype.str, len(values)
+
+
+def _decompose_task(columns: dict, row_start: int, row_end: int, dimensions: list, dimension_values: list, sparse: bool,
+                    effects_backend: str = None) -> pd.DataFrame:
+    """Decomposes the week pairs of one row range of the shared input.
+
+    Args:
+        columns: shared memory description of every column, see _to_shared_memory
+        row_start, row_end: range of the week-sorted rows to decompose
+        dimensions : parameter that you want to decompose the metric change with
+        dimension_values : unique values of each dimension across the whole input
+        sparse : only emit segments with visits in week_before or week_after
+        effects_backend : backend of the effect kernel, see dataProcessing
+
+    Returns:
+        A DataFrame with the decomposition results of the week pairs in the range
+    """
+    blocks = []
+    try:
+        data = {}
+        for column, (name, dtype, length) in columns.items():
+            block = shared_memory.SharedMemory(name=name)
+            blocks.append(block)
+            # Copy the slice out, so no view on the block outlives it
+            data[column] = np.ndarray((length,), dtype=dtype, buffer=block.buf)[row_start:row_end].copy()
+
+        # Dimensions are shared as codes into the global unique values, which may
+        # include a missing value, so the columns are taken from the values
+        metrics_df = pd.DataFrame({
+            'week': data['week'],
+            **{dimension: pd.Index(values).take(data[dimension])
+               for dimension, values in zip(dimensions, dimension_values)},
+            'visits': data['visits'],
+            'conversions': data['conversions']
+        })
+
+        return dataProcessing(plot=False, effects_backend=effects_backend)._decompose_vectorized(metrics_df, dimensions, sparse, dimension_values)
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def decompose_in_parallel(metrics_df: pd.DataFrame, dimension_sets: list, workers: int = None, sparse: bool = False,
+                          effects_backend: str = None) -> list:
+    """Decomposes the week-on-week conversion rate changes for several dimension sets
+    across a process pool.
+
+    Work is split by dimension set and by ranges of consecutive week pairs. The input
+    columns are copied once into shared memory, sorted by week, and every worker
+    attaches to them instead of receiving a pickled DataFrame.
+
+    Args:
+        metrics_df: Dataframe of the csv dataset
+        dimension_sets : list of dimension lists to decompose the metric change with
+        workers : number of worker processes, defaults to the number of CPUs
+        sparse : only emit segments with visits in week_before or week_after
+        effects_backend : 'numpy' or 'numba' backend of the effect kernel, defaults to kernels.BACKEND
+
+    Returns:
+        A list with the decomposition results of each dimension set, in the same order
+        and identical to decompose_and_calculate_effects_by_dimension
+    """
+    workers = workers or os.cpu_count() or 1
+    dimensions = list(dict.fromkeys(dimension for dimension_set in dimension_sets for dimension in dimension_set))
+
+    # Sort the rows by week so every week range is a contiguous slice
+    order = np.argsort(metrics_df['week'].to_numpy(), kind='stable')
+    weeks_column = metrics_df['week'].to_numpy()[order]
+    weeks = np.unique(weeks_column)
+    week_starts = np.searchsorted(weeks_column, weeks, side='left')
+    week_ends = np.searchsorted(weeks_column, weeks, side='right')
+
+    # Split the week pairs into one contiguous range per worker
+    n_pairs = max(len(weeks) - 1, 1)
+    boundaries = np.unique(np.linspace(0, n_pairs, min(workers, n_pairs) + 1).round().astype(int))
+
+    blocks = []
+    try:
+        dimension_values = {}
+        columns = {'week': _to_shared_memory(weeks_column, blocks)}
+        for dimension in dimensions:
+            codes, values = pd.factorize(metrics_df[dimension], use_na_sentinel=False)
+            dimension_values[dimension] = values
+            columns[dimension] = _to_shared_memory(codes[order].astype(np.int32), blocks)
+        for column in ('visits', 'conversions'):
+            columns[column] = _to_shared_memory(metrics_df[column].to_numpy()[order], blocks)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for dimension_set in dimension_sets:
+                set_futures = []
+                for first_pair, last_pair in zip(boundaries[:-1], boundaries[1:]):
+                    if len(weeks):
+                        row_start, row_end = week_starts[first_pair], week_ends[min(last_pair, len(weeks) - 1)]
+                    else:
+                        row_start, row_end = 0, 0
+                    set_futures.append(executor.submit(
+                        _decompose_task, columns, int(row_start), int(row_end), list(dimension_set),
+                        [dimension_values[dimension] for dimension in dimension_set], sparse, effects_backend))
+                futures.append(set_futures)
+
+            return [pd.concat([future.result() for future in set_futures], ignore_index=True)
+                    for set_futures in futures]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
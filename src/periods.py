@@ -0,0 +1,123 @@
+"""
+Decomposition of arbitrary period comparisons, e.g. week over 4 weeks, year over year or rolling windows
+"""
+import numpy as np
+import pandas as pd
+from .data_processing import dataProcessing
+
+
+class periodComparison:
+    """Cumulative per-segment totals of visits and conversions, indexed by week.
+
+    The data is aggregated once, when the object is built. The totals of any range
+    of weeks are then the difference of two rows of the cumulative sums, so every
+    comparison costs O(segments), whatever the number of raw rows or the length of
+    the periods.
+
+    A period is either a week or a (first week, last week) tuple, both inclusive.
+    Weeks missing from the data count as zero.
+    """
+
+    def __init__(self, metrics_df: pd.DataFrame, dimensions: list):
+        """
+        Args:
+            metrics_df: Dataframe of the csv dataset, or an aggregateCube
+            dimensions : parameter that you want to decompose the metric change with
+        """
+        self.dimensions = list(dimensions)
+        self._processor = dataProcessing(plot=False)
+        self.weeks, self.dimension_values, self._segment_dimension_codes, matrices = \
+            self._processor._build_segment_matrices(metrics_df, self.dimensions)
+        # Row i holds the totals of the weeks before self.weeks[i]
+        self._cumulative = {}
+        for metric, matrix in matrices.items():
+            self._cumulative[metric] = np.zeros((len(self.weeks) + 1, matrix.shape[1]), dtype=np.float64)
+            np.cumsum(matrix, axis=0, out=self._cumulative[metric][1:])
+
+    def _bounds(self, period) -> tuple:
+        """Returns the (first week, last week) of a period spec."""
+        first_week, last_week = period if isinstance(period, (tuple, list)) else (period, period)
+        if first_week > last_week:
+            raise ValueError(f"Period {period} ends before it starts")
+        return first_week, last_week
+
+    def totals(self, period) -> dict:
+        """Returns the visits and conversions of every segment summed over the period.
+
+        Args:
+            period: a week, or a (first week, last week) tuple
+
+        Returns:
+            A dict of {metric: array of the segment totals}
+        """
+        first_week, last_week = self._bounds(period)
+        start = np.searchsorted(self.weeks, first_week, side='left')
+        end = np.searchsorted(self.weeks, last_week, side='right')
+        if start == end:
+            raise ValueError(f"Period {period} contains none of the weeks {self.weeks[0]} to {self.weeks[-1]}")
+        return {metric: cumulative[end] - cumulative[start] for metric, cumulative in self._cumulative.items()}
+
+    def compare(self, baseline, comparison, sparse: bool = False) -> pd.DataFrame:
+        """Decomposes the conversion rate change between two periods.
+
+        Args:
+            baseline: period the comparison is measured against
+            comparison: period whose change is decomposed
+            sparse : only emit segments with visits in one of the two periods
+
+        Returns:
+            A DataFrame with the dimensions, the baseline_start, baseline_end,
+            comparison_start and comparison_end weeks, rate_change_effect and
+            proportion_change_effect
+        """
+        return self.compare_many([(baseline, comparison)], sparse)
+
+    def compare_many(self, comparisons: list, sparse: bool = False) -> pd.DataFrame:
+        """Decomposes several (baseline, comparison) period pairs, see compare.
+
+        The rows are ordered by pair, then by segment as in
+        decompose_and_calculate_effects_by_dimension.
+        """
+        results = []
+        for baseline, comparison in comparisons:
+            baseline_totals, comparison_totals = self.totals(baseline), self.totals(comparison)
+            visits = np.vstack([baseline_totals['visits'], comparison_totals['visits']])
+            conversions = np.vstack([baseline_totals['conversions'], comparison_totals['conversions']])
+            rate_change, proportion_change = self._processor._calculate_effects(conversions, visits)
+
+            segment_index = np.arange(visits.shape[1])
+            if sparse:
+                segment_index = np.nonzero((visits[0] != 0) | (visits[1] != 0))[0]
+            pair_df = {}
+            for dimension, values, codes in zip(self.dimensions, self.dimension_values, self._segment_dimension_codes):
+                pair_df[dimension] = np.asarray(values, dtype=object)[codes[segment_index]]
+            pair_df['baseline_start'], pair_df['baseline_end'] = self._bounds(baseline)
+            pair_df['comparison_start'], pair_df['comparison_end'] = self._bounds(comparison)
+            pair_df['rate_change_effect'] = rate_change[0, segment_index]
+            pair_df['proportion_change_effect'] = proportion_change[0, segment_index]
+            results.append(pd.DataFrame(pair_df, index=pd.RangeIndex(len(segment_index))))
+
+        columns = [*self.dimensions, 'baseline_start', 'baseline_end', 'comparison_start', 'comparison_end',
+                   'rate_change_effect', 'proportion_change_effect']
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=columns)
+
+    def week_over_n(self, n: int = 1, sparse: bool = False) -> pd.DataFrame:
+        """Compares every week with the week n weeks earlier, e.g. n=52 for year over year.
+
+        Only the weeks whose baseline week is in the data are compared.
+        """
+        weeks = set(self.weeks.tolist())
+        comparisons = [(week - n, week) for week in self.weeks.tolist() if week - n in weeks]
+        return self.compare_many(comparisons, sparse)
+
+    def rolling(self, window: int, sparse: bool = False) -> pd.DataFrame:
+        """Compares every window of consecutive weeks with the window just before it.
+
+        For instance window=4 compares the weeks (w-3, w) with (w-7, w-4), for every
+        week w whose baseline window starts at or after the first week of the data.
+        """
+        if window < 1:
+            raise ValueError(f"The window must hold at least one week, got {window}")
+        comparisons = [((week - 2 * window + 1, week - window), (week - window + 1, week))
+                       for week in self.weeks.tolist() if week - 2 * window + 1 >= self.weeks[0]]
+        return self.compare_many(comparisons, sparse)
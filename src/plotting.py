@@ -0,0 +1,145 @@
+"""
+File to render the charts of the analysis, either interactively or to image files
+"""
+import re
+import matplotlib
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, MultipleLocator
+
+
+"""
+Fonts used by every chart
+"""
+chart_rc_params = {
+    'font.weight': 'bold',
+    'axes.labelweight': 'bold'
+}
+
+
+def comma_format(x:int, pos):
+    """
+    This functions adds commas to the y-axis numbers
+    Args:
+        x : a number
+    Returns:
+        a formatted number with commas
+    """
+    if x == 0:
+        return "0"
+    elif x % 1 == 0:
+        # Format as int with commas
+        return f'{int(x):,}'
+    else:
+        # Format as float with commas, two decimal places
+        return f'{x:,.6f}'
+
+
+def chart_title(x_col, y_col, group_by_col=None) -> str:
+    """Returns the title of the chart of y_col over x_col."""
+    return f'{y_col.replace("_", " ").title()} Over {x_col.replace("_", " ").title()}' + (f' by {group_by_col.title()}' if group_by_col else '')
+
+
+def chart_file_name(index: int, x_col, y_col, group_by_col=None, file_format: str = 'png') -> str:
+    """Returns a file name for the chart, prefixed with its index to keep it unique."""
+    slug = re.sub(r'[^a-z0-9]+', '_', chart_title(x_col, y_col, group_by_col).lower()).strip('_')
+    return f'{index:03d}_{slug}.{file_format}'
+
+
+def draw_metrics(fig, ax, df: pd.DataFrame, x_col, y_col, group_by_col=None, add_locator=False):
+    """
+    This functions plot dynamically based on the x-axis, y-axis and group_by_col
+    Args:
+        fig : figure to draw on
+        ax : axes to draw on
+        x_col : x-axis column
+        y_col : y-axis column
+        group_by_col : the column to group upon
+        add_locator : update the y-axis tickets based on a value
+    """
+    ax.ticklabel_format(axis='y', style='plain')
+
+    # Initialize max_value for dynamic y-axis limit
+    max_value = 0
+
+    # Determine the data type of x_col
+    if pd.api.types.is_numeric_dtype(df[x_col]):
+        is_numeric_x = True
+    else:
+        is_numeric_x = False
+
+    if group_by_col:
+        # Group the data by the specified column
+        for label, row in df.groupby(group_by_col, observed=True):
+            if is_numeric_x:
+                # Plot the line chart for numeric type x-axis column
+                ax.plot(row[x_col], row[y_col], marker='o', linestyle='-', label=label)
+            else:
+                # Plot the bar chart for numeric type x-axis column
+                ax.bar(row[x_col].astype(str), row[y_col], label=label)
+
+            # Update the max value as per the max value of y-axis column
+            max_value = max(max_value, row[y_col].max())
+        ax.legend(title=group_by_col.title())
+    else:
+        # Plot data without grouping
+        if is_numeric_x:
+            ax.plot(df[x_col], df[y_col], marker='o', linestyle='-')
+        else:
+            ax.bar(df[x_col].astype(str), df[y_col])
+        max_value = df[y_col].max()
+
+    # Handle x-axis label formatting
+    if not is_numeric_x or isinstance(df[x_col].iloc[0], list):
+        ax.set_xticks(df[x_col].apply(lambda x: ', '.join(x) if isinstance(x, list) else str(x)))
+        for tick_label in ax.get_xticklabels():
+            tick_label.set(rotation=45, ha='right')
+    else:
+        ax.set_xticks(df[x_col])
+
+    ax.set_title(chart_title(x_col, y_col, group_by_col))
+    ax.set_xlabel(x_col.replace("_", " ").title())
+    ax.set_ylabel(y_col.replace("_", " ").title())
+
+    # Apply comma formatting to the y-axis
+    ax.yaxis.set_major_formatter(FuncFormatter(comma_format))
+    if add_locator:
+        ax.yaxis.set_minor_locator(MultipleLocator(250000))
+        # Set major ticks with 500,000 increments for the whole range
+        ax.yaxis.set_major_locator(MultipleLocator(250000))
+    if is_numeric_x:
+        # Only show gridlines for line charts (numeric x-axis)
+        ax.grid(True)
+    else:
+        ax.grid(False)
+
+    fig.tight_layout()
+
+
+def show_metrics(df: pd.DataFrame, x_col, y_col, group_by_col=None, add_locator=False):
+    """Draws the chart with pyplot and shows it in an interactive window."""
+    import matplotlib.pyplot as plt
+
+    plt.rcParams.update(chart_rc_params)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    draw_metrics(fig, ax, df, x_col, y_col, group_by_col, add_locator)
+    plt.show()
+
+
+def save_metrics(df: pd.DataFrame, x_col, y_col, group_by_col=None, add_locator=False, output_file: str = None) -> str:
+    """Draws the chart on an Agg canvas and writes it to output_file.
+
+    The figure is not registered with pyplot, so it needs no display, is
+    released as soon as it is written and can be rendered in worker processes.
+
+    Returns:
+        The path of the written file
+    """
+    with matplotlib.rc_context(chart_rc_params):
+        fig = Figure(figsize=(12, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        draw_metrics(fig, ax, df, x_col, y_col, group_by_col, add_locator)
+        fig.savefig(output_file)
+    return output_file
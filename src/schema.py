@@ -1,6 +1,10 @@
 """
 File to define schema for the dataframe
 """
+import warnings
+
+import numpy as np
+import pandas as pd
 
 
 """
@@ -12,4 +16,83 @@ metrics_schema =  {
     'country': 'str',
     'visits': 'int',
     'conversions':'int'
-}
\ No newline at end of file
+}
+
+"""
+Memory efficient schema: categorical dimensions and narrow unsigned counters
+"""
+compact_metrics_schema = {
+    'week': 'uint16',
+    'browser': 'category',
+    'country': 'category',
+    'visits': 'uint32',
+    'conversions': 'uint32'
+}
+
+"""
+Fraction of an unsigned dtype's range above which a counter is flagged as an overflow risk
+"""
+overflow_warning_ratio = 0.5
+
+
+def validate_counter_ranges(metrics_df: pd.DataFrame, dtypes: dict = compact_metrics_schema) -> None:
+    """Checks that the integer columns fit into the narrow dtypes of the schema.
+
+    Args:
+        metrics_df: Dataframe with the wide (int64) counters
+        dtypes: schema with the target dtypes
+
+    Raises:
+        ValueError: if a column holds negative values or values above the dtype maximum
+    """
+    for column, dtype in dtypes.items():
+        if column not in metrics_df.columns or not pd.api.types.is_unsigned_integer_dtype(dtype):
+            continue
+        values = metrics_df[column]
+        if values.empty:
+            continue
+
+        limit = np.iinfo(dtype).max
+        minimum, maximum = values.min(), values.max()
+        if minimum < 0:
+            raise ValueError(f"Column '{column}' has negative values and cannot be stored as {dtype}")
+        if maximum > limit:
+            raise ValueError(f"Column '{column}' has values up to {maximum:,} which overflow {dtype} (max {limit:,})")
+        if maximum > limit * overflow_warning_ratio:
+            warnings.warn(
+                f"Column '{column}' uses {maximum / limit:.0%} of the {dtype} range, "
+                f"sums over future data may overflow", RuntimeWarning)
+
+
+def to_compact_dtypes(metrics_df: pd.DataFrame, dtypes: dict = compact_metrics_schema) -> pd.DataFrame:
+    """Converts the Dataframe to the compact schema after validating the counter ranges.
+
+    Args:
+        metrics_df: Dataframe of the csv dataset
+        dtypes: schema with the target dtypes
+
+    Returns:
+        A DataFrame with categorical dimensions and downcast counters
+    """
+    validate_counter_ranges(metrics_df, dtypes)
+    return metrics_df.astype({column: dtype for column, dtype in dtypes.items() if column in metrics_df.columns})
+
+"""
+Optional additive metric columns, parsed when the csv file has them
+"""
+optional_metrics_schema = {
+    'revenue': 'float'
+}
+
+"""
+Ratio metrics decomposed by default, as (numerator, denominator) columns
+"""
+metric_pairs = [
+    ('conversions', 'visits')
+]
+
+
+def effect_columns(numerator: str, denominator: str) -> tuple:
+    """Returns the names of the rate and proportion change effect columns of a ratio metric."""
+    metric = f'{numerator}_per_{denominator}'
+    return f'{metric}_rate_change_effect', f'{metric}_proportion_change_effect'
@@ -0,0 +1,238 @@
+"""
+Local HTTP service answering decomposition and weekly metric queries from warm in-memory state
+
+The csv is parsed and aggregated into a cube once, when the service starts. Every
+request is then answered from the cube, and the decompositions are memoized per
+dimension list, so repeated queries only cost the serialization.
+
+    python -m src.service "S&A - Written Project - Data Set - raw_data.csv" --port 8000
+
+    GET /decompose?dimensions=country,browser&sparse=1&format=json
+    GET /weekly?dimensions=country&format=arrow
+    GET /stats
+"""
+import argparse
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+from . import schema
+from .data_processing import dataProcessing
+
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+class analysisService:
+    """Warm state of the service: the parsed data, its cube and the memoized results.
+
+    The methods are safe to call from concurrent request threads. Only the cube
+    rollups and the cache bookkeeping are serialized. Queries are computed outside
+    of the locks, and concurrent requests for the same missing query wait for the
+    first one instead of computing it again.
+    """
+
+    def __init__(self, metrics_df: pd.DataFrame, max_results: int = 128):
+        """
+        Args:
+            metrics_df: Dataframe of the csv dataset
+            max_results: number of query results kept in the least recently used cache
+        """
+        self.processor = dataProcessing(plot=False)
+        self.dimensions = [column for column in schema.metrics_schema if column not in ('week', 'visits', 'conversions')]
+        self.cube = self.processor.build_cube(metrics_df, self.dimensions)
+        self.max_results = max_results
+        self._results = OrderedDict()
+        # Futures of the queries being computed
+        self._computing = {}
+        # Guards the result cache, the futures and the counters
+        self._lock = threading.Lock()
+        # The memoized rollups of the cube are not thread-safe
+        self._cube_lock = threading.Lock()
+        self.stats = {'hit': 0, 'miss': 0}
+        self.latency = {}
+
+    def _parse_dimensions(self, dimensions) -> list:
+        """Returns the dimension list of a query, validated against the cube."""
+        if isinstance(dimensions, str):
+            dimensions = [dimension for dimension in dimensions.split(',') if dimension]
+        dimensions = list(dimensions or [])
+        unknown = [dimension for dimension in dimensions if dimension not in self.dimensions]
+        if unknown or len(set(dimensions)) != len(dimensions):
+            raise ValueError(f"Invalid dimensions {dimensions}, available: {self.dimensions}")
+        return dimensions
+
+    def _cached(self, cache_key: tuple, compute) -> pd.DataFrame:
+        """Returns the memoized result of a query, computing it outside of the lock on a miss."""
+        with self._lock:
+            if cache_key in self._results:
+                self.stats['hit'] += 1
+                self._results.move_to_end(cache_key)
+                return self._results[cache_key]
+            # A request already computing the same query owns its future
+            owner = cache_key not in self._computing
+            if owner:
+                self._computing[cache_key] = Future()
+            future = self._computing[cache_key]
+            self.stats['miss' if owner else 'hit'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            results_df = compute()
+        except BaseException as error:
+            with self._lock:
+                del self._computing[cache_key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            del self._computing[cache_key]
+            self._results[cache_key] = results_df
+            if len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        future.set_result(results_df)
+        return results_df
+
+    def _rollup(self, keys: list) -> pd.DataFrame:
+        """Returns the sums of the cube per keys, the only step that reads its memoized rollups."""
+        with self._cube_lock:
+            return self.processor._aggregate(self.cube, keys)
+
+    def decompose(self, dimensions, sparse: bool = False) -> pd.DataFrame:
+        """Returns decompose_and_calculate_effects_by_dimension for the dimensions."""
+        dimensions = self._parse_dimensions(dimensions)
+        if not dimensions:
+            raise ValueError(f"At least one dimension is required, available: {self.dimensions}")
+        return self._cached(('decompose', tuple(dimensions), sparse),
+                            lambda: self.processor.decompose_and_calculate_effects_by_dimension(self._rollup(['week', *dimensions]), dimensions, sparse=sparse))
+
+    def weekly(self, dimensions=None) -> pd.DataFrame:
+        """Returns the visits, conversions and conversion rate per week and dimension values."""
+        dimensions = self._parse_dimensions(dimensions)
+
+        def compute():
+            keys = ['week', *dimensions]
+            weekly_df = self._rollup(keys).sort_values(keys, ignore_index=True)
+            weekly_df['conversion_rate'] = weekly_df['conversions'] / weekly_df['visits']
+            return weekly_df
+        return self._cached(('weekly', tuple(dimensions)), compute)
+
+    def record_latency(self, endpoint: str, seconds: float):
+        with self._lock:
+            latency = self.latency.setdefault(endpoint, {'requests': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            latency['requests'] += 1
+            latency['seconds'] += seconds
+            latency['max_seconds'] = max(latency['max_seconds'], seconds)
+
+    def stats_report(self) -> dict:
+        """Returns the hit rates of the result cache and of the cube rollups, and the latency per endpoint."""
+        with self._cube_lock:
+            cube_stats = {**self.cube.stats, 'cached_bytes': self.cube.cached_bytes}
+        with self._lock:
+            lookups = self.stats['hit'] + self.stats['miss']
+            rollup_lookups = cube_stats['hit'] + cube_stats['miss']
+            return {
+                'results': {**self.stats, 'hit_rate': self.stats['hit'] / lookups if lookups else None, 'cached': len(self._results)},
+                'cube': {**cube_stats, 'hit_rate': cube_stats['hit'] / rollup_lookups if rollup_lookups else None},
+                'latency': {endpoint: {**latency, 'mean_seconds': latency['seconds'] / latency['requests']}
+                            for endpoint, latency in self.latency.items()}
+            }
+
+
+def to_arrow(results_df: pd.DataFrame) -> bytes:
+    """Serializes a DataFrame as an Arrow IPC stream, requires pyarrow."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(results_df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class analysisRequestHandler(BaseHTTPRequestHandler):
+    """Routes the GET requests to the analysisService of the server."""
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        endpoint = url.path.rstrip('/') or '/'
+        try:
+            if endpoint == '/decompose':
+                self._send_frame(service.decompose(query.get('dimensions', ''), query.get('sparse', '0') in ('1', 'true')), query)
+            elif endpoint == '/weekly':
+                self._send_frame(service.weekly(query.get('dimensions', '')), query)
+            elif endpoint == '/stats':
+                self._send_json(200, service.stats_report())
+            else:
+                self._send_json(404, {'error': f"Unknown endpoint {url.path}"})
+        except ValueError as error:
+            self._send_json(400, {'error': str(error)})
+        except ImportError:
+            self._send_json(406, {'error': 'The arrow format requires pyarrow'})
+        except Exception as error:
+            self._send_json(500, {'error': f"{type(error).__name__}: {error}"})
+        finally:
+            service.record_latency(endpoint, time.perf_counter() - start)
+
+    def _send_frame(self, results_df: pd.DataFrame, query: dict):
+        output_format = query.get('format', 'json')
+        if output_format == 'arrow':
+            self._send(200, ARROW_CONTENT_TYPE, to_arrow(results_df))
+        elif output_format == 'json':
+            self._send(200, 'application/json', results_df.to_json(orient='records').encode())
+        else:
+            raise ValueError(f"Unknown format {output_format}, expected json or arrow")
+
+    def _send_json(self, status: int, payload: dict):
+        self._send(status, 'application/json', json.dumps(payload).encode())
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are counted in /stats instead of being written to stderr
+        pass
+
+
+def make_server(service: analysisService, host: str = '127.0.0.1', port: int = 8000) -> ThreadingHTTPServer:
+    """Returns a server answering every request in its own thread, port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), analysisRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the conversion rate analysis over HTTP')
+    parser.add_argument('file_location', help='csv file of the dataset')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics_df = dataProcessing(plot=False).read_csv_from_filepath_cached(args.file_location)
+    server = make_server(analysisService(metrics_df), args.host, args.port)
+    print(f'Serving on http://{server.server_address[0]}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
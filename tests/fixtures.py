@@ -0,0 +1,12 @@
+import pandas as pd
+
+
+def sample_metrics() -> pd.DataFrame:
+    """Returns three weeks of metrics, with the (C, Safari) segment missing from the second week."""
+    return pd.DataFrame({
+        'week': [1, 1, 1, 1, 2, 2, 2, 3, 3, 3, 3],
+        'country': ['A', 'B', 'A', 'C', 'A', 'B', 'B', 'A', 'B', 'C', 'C'],
+        'browser': ['Chrome', 'Firefox', 'Firefox', 'Safari', 'Chrome', 'Firefox', 'Chrome', 'Chrome', 'Firefox', 'Safari', 'Chrome'],
+        'visits': [1000, 1500, 300, 200, 2000, 2500, 400, 1800, 2600, 150, 50],
+        'conversions': [100, 150, 20, 10, 200, 250, 50, 170, 240, 20, 0]
+    })
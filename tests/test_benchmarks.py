@@ -0,0 +1,35 @@
+import unittest
+from benchmarks import bench_pipeline
+from benchmarks.synthetic import generate_metrics
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_generate_metrics(self):
+        metrics_df = generate_metrics(weeks=3, countries=4, browsers=2, extra_dimensions={'device': 3}, density=1.0)
+
+        self.assertEqual(len(metrics_df), 3 * 4 * 2 * 3)
+        self.assertEqual(list(metrics_df.columns), ['week', 'browser', 'country', 'device', 'visits', 'conversions'])
+        self.assertTrue((metrics_df['conversions'] <= metrics_df['visits']).all())
+
+        sparse_df = generate_metrics(weeks=3, countries=4, browsers=2, density=0.5)
+        self.assertLess(len(sparse_df), 3 * 4 * 2)
+
+    def test_pipeline_benchmark_checks_parity(self):
+        results = bench_pipeline.run(['tiny'], repeat=1)
+        records = results['records']
+
+        self.assertEqual({record['engine'] for record in records}, {None, *bench_pipeline.ENGINES})
+        self.assertTrue(all(record['parity'] for record in records if record['engine'] not in (None, 'loop')))
+        self.assertEqual({record['reference_engine'] for record in records if record['engine']}, {'loop'})
+        self.assertTrue(all(record['seconds'] > 0 and record['peak_bytes'] > 0 for record in records))
+
+        # Without the loop engine, the next registered engine is the reference
+        records_without_loop = bench_pipeline.run(['tiny'], repeat=1, max_loop_rows=0)['records']
+        self.assertNotIn('loop', {record['engine'] for record in records_without_loop})
+        self.assertEqual({record['reference_engine'] for record in records_without_loop if record['engine']}, {'vectorized'})
+        self.assertTrue(all(record['parity'] for record in records_without_loop if record['engine'] not in (None, 'vectorized')))
+
+        comparison = bench_pipeline.compare(results, results)
+        self.assertEqual(len(comparison), len(records))
+        self.assertTrue((comparison['speedup'] == 1).all())
@@ -0,0 +1,47 @@
+import unittest
+import pandas as pd
+from src.cube import aggregateCube
+from src.data_processing import dataProcessing
+from tests.fixtures import sample_metrics
+
+
+class TestAggregateCube(unittest.TestCase):
+
+    def test_analyses_match_raw_data(self):
+        metrics_df = sample_metrics()
+        processor = dataProcessing(plot=False)
+        cube = processor.build_cube(metrics_df)
+
+        pd.testing.assert_frame_equal(processor.transform_data(cube), processor.transform_data(metrics_df))
+        pd.testing.assert_frame_equal(processor.analyze_metrics_per_country(cube), processor.analyze_metrics_per_country(metrics_df))
+        for dimensions in (['country'], ['browser'], ['country', 'browser']):
+            pd.testing.assert_frame_equal(
+                processor.decompose_and_calculate_effects_by_dimension(cube, dimensions),
+                processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions))
+        pd.testing.assert_frame_equal(
+            processor.decompose_and_calculate_effects_by_country_browser(cube, engine='loop'),
+            processor.decompose_and_calculate_effects_by_country_browser(metrics_df, engine='loop'))
+
+        # The (week) rollup is shared by transform_data and analyze_metrics_per_country
+        self.assertGreater(cube.stats['hit'], 0)
+
+    def test_rollups_are_memoized_within_budget(self):
+        metrics_df = sample_metrics()
+        cube = aggregateCube(metrics_df)
+
+        weekly_df = cube.rollup(['week'])
+        weekly_df['visits'] = 0
+        self.assertEqual(cube.rollup(['week'])['visits'].sum(), metrics_df['visits'].sum())
+        self.assertEqual(cube.stats, {'hit': 1, 'miss': 1, 'eviction': 0})
+
+        # Shrinking the budget evicts the least recently used rollup first
+        cube.rollup(['country'])
+        cube.max_bytes = cube.cached_bytes - 1
+        cube.rollup(['browser'])
+        self.assertGreaterEqual(cube.stats['eviction'], 1)
+        self.assertLessEqual(cube.cached_bytes, cube.max_bytes)
+        cube.rollup(['week'])
+        self.assertEqual(cube.stats['miss'], 4)
+
+        with self.assertRaises(ValueError):
+            cube.rollup(['device'])
@@ -1,7 +1,13 @@
+import importlib.util
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import pytest
 import unittest
+from src import schema
 from src.data_processing import dataProcessing
+from tests.fixtures import sample_metrics
 import warnings
 warnings.filterwarnings("ignore", message="numpy.dtype size changed")
 warnings.filterwarnings("ignore", message="numpy.ufunc size changed")
@@ -30,6 +36,215 @@ class TestDataProcessing(unittest.TestCase):
                 position //= len(lst)
             return combination
         
+    def test_vectorized_decomposition_matches_loop(self):
+        metrics_df = sample_metrics()
+        processor = dataProcessing()
+
+        for dimensions in (['country'], ['country', 'browser'], ['browser', 'country']):
+            expected = processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, engine='loop')
+            actual = processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions)
+            pd.testing.assert_frame_equal(actual, expected)
+
+        pd.testing.assert_frame_equal(
+            processor.decompose_and_calculate_effects_by_country(metrics_df),
+            processor.decompose_and_calculate_effects_by_country(metrics_df, engine='loop'))
+        pd.testing.assert_frame_equal(
+            processor.decompose_and_calculate_effects_by_country_browser(metrics_df),
+            processor.decompose_and_calculate_effects_by_country_browser(metrics_df, engine='loop'))
+
+        # Rows with a missing dimension value, e.g. the country code NA parsed by
+        # read_csv, are a segment of their own and count in the weekly totals
+        missing_df = pd.DataFrame({
+            'week': [1, 1, 2, 2],
+            'country': ['AA', np.nan, 'AA', np.nan],
+            'browser': ['Chrome', 'Chrome', 'Chrome', 'Chrome'],
+            'visits': [1000, 500, 1000, 1500],
+            'conversions': [100, 40, 120, 90]
+        })
+        for dimensions in (['country'], ['country', 'browser']):
+            expected = processor.decompose_and_calculate_effects_by_dimension(missing_df, dimensions, engine='loop')
+            actual = processor.decompose_and_calculate_effects_by_dimension(missing_df, dimensions)
+            self.assertEqual(len(actual), 2)
+            pd.testing.assert_frame_equal(actual, expected)
+        sparse_df = processor.decompose_and_calculate_effects_by_dimension(missing_df, ['country'], sparse=True)
+        self.assertEqual(sparse_df['country'].isna().sum(), 1)
+        self.assertAlmostEqual(sparse_df['rate_change_effect'].sum() + sparse_df['proportion_change_effect'].sum(), 210 / 2500 - 140 / 1500)
+
+    def test_sparse_decomposition_keeps_effect_sums(self):
+        metrics_df = sample_metrics()
+        processor = dataProcessing()
+        dimensions = ['country', 'browser']
+
+        dense = processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions)
+        sparse = processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, sparse=True)
+
+        # (A, Safari) never occurs and (C, Chrome) only occurs in the third week
+        self.assertEqual(len(dense), 18)
+        self.assertEqual(len(sparse), 10)
+        self.assertFalse(((sparse['country'] == 'A') & (sparse['browser'] == 'Safari')).any())
+        self.assertIsInstance(sparse['country'].dtype, pd.CategoricalDtype)
+
+        effects = ['rate_change_effect', 'proportion_change_effect']
+        pd.testing.assert_frame_equal(
+            sparse.groupby('week_before')[effects].sum(),
+            dense.groupby('week_before')[effects].sum())
+
+        with self.assertRaises(ValueError):
+            processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, engine='loop', sparse=True)
+
+    def test_chunked_csv_reader_matches_full_read(self):
+        processor = dataProcessing()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'metrics.csv')
+            # Duplicate the rows so segments have to be merged across chunks
+            pd.concat([sample_metrics()] * 2).to_csv(file_location, index=False)
+
+            raw_df = processor.read_csv_from_filepath(file_location)
+            aggregate_df = processor.read_csv_from_filepath_in_chunks(file_location, chunksize=4)
+
+        self.assertEqual(len(aggregate_df), len(sample_metrics()))
+        self.assertEqual(list(aggregate_df.columns), ['week', 'browser', 'country', 'visits', 'conversions'])
+        self.assertEqual(aggregate_df['visits'].sum(), raw_df['visits'].sum())
+        pd.testing.assert_frame_equal(
+            processor.decompose_and_calculate_effects_by_dimension(aggregate_df, ['country', 'browser']),
+            processor.decompose_and_calculate_effects_by_dimension(raw_df, ['country', 'browser']))
+
+    def test_sharded_csv_reader_matches_chunked_read(self):
+        processor = dataProcessing()
+        metrics_df = sample_metrics()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # One shard per row, half of them gzip compressed
+            for index in range(len(metrics_df)):
+                extension = 'csv.gz' if index % 2 else 'csv'
+                metrics_df.iloc[[index]].to_csv(os.path.join(tmp_dir, f'shard-{index:03d}.{extension}'), index=False)
+            combined_file = os.path.join(tmp_dir, 'combined.txt')
+            metrics_df.to_csv(combined_file, index=False)
+
+            expected = processor.read_csv_from_filepath_in_chunks(combined_file, chunksize=4)
+            for processes in (False, True):
+                sharded_df = processor.read_csv_from_filepaths(os.path.join(tmp_dir, 'shard-*'), workers=2, max_in_flight=3, processes=processes)
+                pd.testing.assert_frame_equal(sharded_df, expected)
+
+            with self.assertRaises(FileNotFoundError):
+                processor.read_csv_from_filepaths([os.path.join(tmp_dir, 'missing-*.csv')])
+
+    def test_compact_schema_decomposition(self):
+        processor = dataProcessing()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'metrics.csv')
+            sample_metrics().to_csv(file_location, index=False)
+
+            raw_df = processor.read_csv_from_filepath(file_location)
+            compact_df = processor.read_csv_from_filepath(file_location, compact=True)
+
+        self.assertIsInstance(compact_df['browser'].dtype, pd.CategoricalDtype)
+        self.assertEqual(compact_df['conversions'].dtype, 'uint32')
+        for engine in ('loop', 'vectorized'):
+            pd.testing.assert_frame_equal(
+                processor.decompose_and_calculate_effects_by_dimension(compact_df, ['country', 'browser'], engine=engine),
+                processor.decompose_and_calculate_effects_by_dimension(raw_df, ['country', 'browser'], engine=engine),
+                check_dtype=False)
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_columnar_cache(self):
+        processor = dataProcessing()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'metrics.csv')
+            sample_metrics().to_csv(file_location, index=False)
+
+            first_df = processor.read_csv_from_filepath_cached(file_location)
+            second_df = processor.read_csv_from_filepath_cached(file_location)
+            self.assertEqual(processor.cache_stats, {'hit': 1, 'miss': 1, 'disabled': 0})
+            pd.testing.assert_frame_equal(second_df, first_df)
+            pd.testing.assert_frame_equal(second_df, processor.read_csv_from_filepath(file_location))
+
+            # Touching the file without changing its content keeps the cache valid
+            os.utime(file_location, (0, 0))
+            processor.read_csv_from_filepath_cached(file_location)
+            self.assertEqual(processor.cache_stats['hit'], 2)
+
+            # Changing the content invalidates it
+            sample_metrics().head(4).to_csv(file_location, index=False)
+            changed_df = processor.read_csv_from_filepath_cached(file_location)
+            self.assertEqual(processor.cache_stats['miss'], 2)
+            self.assertEqual(len(changed_df), 4)
+
+            compact_df = processor.read_csv_from_filepath_cached(file_location, compact=True)
+            compact_df = processor.read_csv_from_filepath_cached(file_location, compact=True)
+            self.assertEqual(processor.cache_stats, {'hit': 3, 'miss': 3, 'disabled': 0})
+            self.assertIsInstance(compact_df['country'].dtype, pd.CategoricalDtype)
+            self.assertEqual(compact_df['visits'].dtype, 'uint32')
+
+    def test_headless_plot_rendering(self):
+        metrics_df = sample_metrics()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            processor = dataProcessing(plot_dir=tmp_dir, plot_format='svg', plot_workers=2)
+            weekly_df = processor.transform_data(metrics_df)
+            processor.analyze_metrics_per_country(metrics_df)
+            paths = processor.wait_for_plots()
+
+            self.assertEqual(len(paths), 4)
+            self.assertEqual(sorted(os.listdir(tmp_dir)), sorted(os.path.basename(path) for path in paths))
+            self.assertTrue(all(path.endswith('.svg') for path in paths))
+
+        # Without plotting the same DataFrames are returned and nothing is rendered
+        processor = dataProcessing(plot=False)
+        pd.testing.assert_frame_equal(processor.transform_data(metrics_df), weekly_df)
+        self.assertEqual(processor.wait_for_plots(), [])
+
+    def test_top_contributors(self):
+        processor = dataProcessing(plot=False)
+        results_df = processor.decompose_and_calculate_effects_by_dimension(sample_metrics(), ['country', 'browser'])
+
+        top_df = processor.top_contributors(results_df, 'rate_change_effect', k=3, dimension=['country', 'browser'])
+        expected = results_df.sort_values('rate_change_effect', ascending=False).head(3)
+        pd.testing.assert_frame_equal(top_df.drop(columns='country - browser'), expected)
+        self.assertEqual(list(top_df['country - browser']), [f'{country} - {browser}' for country, browser in zip(expected['country'], expected['browser'])])
+
+        by_magnitude = processor.top_contributors(results_df, 'proportion_change_effect', k=2, by_magnitude=True)
+        self.assertEqual(list(by_magnitude.index), list(results_df['proportion_change_effect'].abs().nlargest(2).index))
+
+        per_pair = processor.top_contributors(results_df, 'rate_change_effect', k=2, per_week_pair=True)
+        self.assertEqual(len(per_pair), 4)
+        self.assertEqual(list(per_pair['week_before']), [1, 1, 2, 2])
+
+        # analyze_decomposition_by_dimension is built on top of it
+        top_rate, top_proportion = processor.analyze_decomposition_by_dimension(results_df, ['country', 'browser'])
+        pd.testing.assert_frame_equal(top_rate, processor.top_contributors(results_df, 'rate_change_effect', dimension=['country', 'browser']))
+
+    def test_multi_metric_decomposition(self):
+        metrics_df = sample_metrics()
+        metrics_df['revenue'] = metrics_df['conversions'] * 12.5 + metrics_df['visits'] * 0.1
+        processor = dataProcessing(plot=False)
+        dimensions = ['country', 'browser']
+        metric_pairs = [('conversions', 'visits'), ('revenue', 'visits'), ('revenue', 'conversions')]
+
+        # (C, Chrome) has revenue but no conversions in the third week, no effect accounts for it
+        with self.assertWarns(RuntimeWarning):
+            results_df = processor.decompose_metrics_by_dimension(metrics_df, dimensions, metric_pairs)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            cube_results_df = processor.decompose_metrics_by_dimension(processor.build_cube(metrics_df), dimensions, metric_pairs)
+        pd.testing.assert_frame_equal(cube_results_df, results_df)
+
+        # Every pair matches the single metric decomposition of that ratio
+        for numerator, denominator in metric_pairs:
+            rate_column, proportion_column = schema.effect_columns(numerator, denominator)
+            single_metric_df = metrics_df[['week', *dimensions]].assign(conversions=metrics_df[numerator], visits=metrics_df[denominator])
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                expected = processor.decompose_and_calculate_effects_by_dimension(single_metric_df, dimensions)
+            pd.testing.assert_frame_equal(
+                results_df[[*dimensions, 'week_before', 'week_after', rate_column, proportion_column]],
+                expected.rename(columns={'rate_change_effect': rate_column, 'proportion_change_effect': proportion_column}))
+
+        default_df = processor.decompose_metrics_by_dimension(metrics_df, dimensions)
+        self.assertEqual(list(default_df.columns[-2:]), list(schema.effect_columns('conversions', 'visits')))
+
+    def test_unknown_decomposition_engine(self):
+        with self.assertRaises(ValueError):
+            dataProcessing().decompose_and_calculate_effects_by_dimension(sample_metrics(), ['country'], engine='spark')
+
     def decompose_and_calculate_effects(self, metrics_df, dimensions):
         results = dataProcessing().decompose_and_calculate_effects_by_country(metrics_df, dimensions)
             
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from src.data_processing import dataProcessing
+from src.incremental import incrementalDecomposition
+from tests.fixtures import sample_metrics
+
+
+class TestIncrementalDecomposition(unittest.TestCase):
+
+    def test_incremental_matches_full_recompute(self):
+        metrics_df = sample_metrics()
+        dimensions = ['country', 'browser']
+
+        state = incrementalDecomposition(dimensions)
+        state.add_week(metrics_df[metrics_df['week'] == 1])
+        added = state.add_week(metrics_df[metrics_df['week'] == 2])
+        self.assertEqual(set(added['week_after']), {2})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'state.pkl')
+            state.save(file_location)
+            state = incrementalDecomposition.load(file_location)
+
+        state.add_week(metrics_df[metrics_df['week'] == 3])
+        self.assertEqual(state.weeks, [1, 2, 3])
+
+        expected = dataProcessing().decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, sparse=True)
+        expected = expected.astype({dimension: object for dimension in dimensions})
+        sort_columns = ['week_before', *dimensions]
+        pd.testing.assert_frame_equal(
+            state.results_df().sort_values(sort_columns).reset_index(drop=True),
+            expected.sort_values(sort_columns).reset_index(drop=True))
+
+    def test_rejects_past_weeks(self):
+        metrics_df = sample_metrics()
+        state = incrementalDecomposition(['country'])
+        state.add_week(metrics_df[metrics_df['week'] == 2])
+        with self.assertRaises(ValueError):
+            state.add_week(metrics_df[metrics_df['week'] == 1])
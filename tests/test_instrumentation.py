@@ -0,0 +1,79 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+import pandas as pd
+from src import instrumentation
+from src.data_processing import dataProcessing
+from tests.fixtures import sample_metrics
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def test_disabled_records_nothing(self):
+        dataProcessing().decompose_and_calculate_effects_by_dimension(sample_metrics(), ['country'])
+        self.assertTrue(instrumentation.report().empty)
+
+    def test_stage_report(self):
+        metrics_df = sample_metrics()
+        processor = dataProcessing(plot=False)
+
+        instrumentation.enable(profile=True)
+        processor.transform_data(metrics_df)
+        processor.decompose_and_calculate_effects_by_dimension(metrics_df, ['country'], engine='loop')
+        instrumentation.disable()
+
+        report_df = instrumentation.report().set_index('stage')
+        self.assertEqual(report_df.loc['transform_data', 'calls'], 1)
+        self.assertEqual(report_df.loc['transform_data', 'rows'], len(metrics_df))
+        # Two week pairs times three countries
+        self.assertEqual(report_df.loc['query', 'calls'], 6)
+        self.assertGreater(report_df.loc['decompose_and_calculate_effects_by_dimension', 'peak_bytes'], 0)
+        self.assertGreaterEqual(report_df.loc['decompose_and_calculate_effects_by_dimension', 'seconds'], report_df.loc['query', 'seconds'])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            instrumentation.export_report(os.path.join(tmp_dir, 'report.json'))
+            instrumentation.export_report(os.path.join(tmp_dir, 'report.csv'))
+            instrumentation.dump_profile(os.path.join(tmp_dir, 'run.prof'))
+
+            with open(os.path.join(tmp_dir, 'report.json')) as file:
+                self.assertEqual(len(json.load(file)), len(report_df))
+            self.assertEqual(len(pd.read_csv(os.path.join(tmp_dir, 'report.csv'))), len(report_df))
+            self.assertGreater(pstats.Stats(os.path.join(tmp_dir, 'run.prof')).total_calls, 0)
+
+        self.assertIn('transform_data', instrumentation.summary_table())
+
+    def test_parent_peak_before_child_stage(self):
+        @instrumentation.instrument()
+        def child():
+            return bytearray(1024)
+
+        @instrumentation.instrument()
+        def parent():
+            block = bytearray(8 * 2 ** 20)
+            del block
+            child()
+
+        instrumentation.enable()
+        parent()
+        instrumentation.disable()
+
+        report_df = instrumentation.report().set_index('stage')
+        self.assertGreaterEqual(report_df.loc['parent', 'peak_bytes'], 8 * 2 ** 20)
+        self.assertLess(report_df.loc['child', 'peak_bytes'], 8 * 2 ** 20)
+
+    def test_reader_rows(self):
+        metrics_df = sample_metrics()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'metrics.csv')
+            metrics_df.to_csv(file_location, index=False)
+            instrumentation.enable()
+            dataProcessing(plot=False).read_csv_from_filepath(file_location)
+            instrumentation.disable()
+
+        self.assertEqual(instrumentation.report().set_index('stage').loc['read_csv_from_filepath', 'rows'], len(metrics_df))
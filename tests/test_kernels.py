@@ -0,0 +1,77 @@
+import importlib.util
+import unittest
+import warnings
+from unittest import mock
+import numpy as np
+from src import kernels
+from src.data_processing import dataProcessing
+
+
+class TestKernels(unittest.TestCase):
+
+    def sample_arrays(self):
+        rng = np.random.default_rng(7)
+        visits = rng.integers(0, 1000, size=(5, 12)).astype(np.float64)
+        visits[2, 3] = 0
+        visits[4] = 0
+        conversions = np.floor(visits * rng.uniform(0, 0.2, size=visits.shape))
+        return conversions, visits
+
+    def test_loop_matches_numpy(self):
+        conversions, visits = self.sample_arrays()
+        rate_change, proportion_change = kernels.calculate_effects(conversions, visits, backend='numpy')
+
+        # The loop is the kernel numba compiles, run here without the JIT
+        loop_rate_change, loop_proportion_change = np.empty_like(rate_change), np.empty_like(proportion_change)
+        kernels._effects_loop(conversions, visits, loop_rate_change, loop_proportion_change)
+        np.testing.assert_allclose(loop_rate_change, rate_change, rtol=1e-12)
+        np.testing.assert_allclose(loop_proportion_change, proportion_change, rtol=1e-12)
+
+    def test_effect_sums(self):
+        conversions, visits = self.sample_arrays()
+        rate_change, proportion_change = kernels.calculate_effects(conversions, visits, check=False)
+        residual = kernels.check_effect_sums(conversions, visits, rate_change, proportion_change)
+        # The last week has no visits, so its pair is not checked
+        self.assertTrue(np.isnan(residual[-1]))
+        self.assertLess(np.abs(residual[:-1]).max(), 1e-12)
+
+        rate_change[0, 0] += 1e-6
+        with self.assertRaises(ArithmeticError):
+            kernels.check_effect_sums(conversions, visits, rate_change, proportion_change)
+        with self.assertRaises(ValueError):
+            kernels.calculate_effects(conversions, visits, backend='fortran')
+
+    @unittest.skipIf(importlib.util.find_spec('numba'), 'numba is installed')
+    def test_numba_backend_falls_back_to_numpy(self):
+        conversions, visits = self.sample_arrays()
+        expected = kernels.calculate_effects(conversions, visits, backend='numpy')
+        with mock.patch.object(kernels, '_numba_missing', False):
+            with self.assertWarns(RuntimeWarning):
+                effects = kernels.calculate_effects(conversions, visits, backend='numba')
+            # The missing numba is only reported once
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                kernels.calculate_effects(conversions, visits, backend='numba')
+        for actual, expected_effect in zip(effects, expected):
+            np.testing.assert_array_equal(actual, expected_effect)
+
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            dataProcessing(plot=False, effects_backend='fortran')
+
+    @unittest.skipUnless(importlib.util.find_spec('numba'), 'numba is not installed')
+    def test_numba_matches_numpy(self):
+        conversions, visits = self.sample_arrays()
+        for compiled, expected in zip(kernels.calculate_effects(conversions, visits, backend='numba'),
+                                      kernels.calculate_effects(conversions, visits, backend='numpy')):
+            np.testing.assert_allclose(compiled, expected, rtol=1e-12)
+
+    def test_numerator_without_denominator(self):
+        conversions, visits = self.sample_arrays()
+        # Conversions in a segment without visits have a zero rate in the decomposition
+        conversions[2, 3] = 40
+        rate_change, proportion_change = kernels.calculate_effects(conversions, visits, check=False)
+        with self.assertWarns(RuntimeWarning):
+            residual = kernels.check_effect_sums(conversions, visits, rate_change, proportion_change)
+        self.assertAlmostEqual(residual[1], 40 / visits[2].sum())
+        self.assertAlmostEqual(residual[2], -40 / visits[2].sum())
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+import pandas as pd
+from src import out_of_core
+from src.data_processing import dataProcessing
+from tests.fixtures import sample_metrics
+
+
+class TestOutOfCore(unittest.TestCase):
+
+    def test_matches_in_memory_results(self):
+        metrics_df = sample_metrics()
+        processor = dataProcessing(plot=False)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'metrics.csv')
+            partition_dir = os.path.join(tmp_dir, 'partitions')
+            output_file = os.path.join(tmp_dir, 'results.csv')
+            metrics_df.to_csv(file_location, index=False)
+
+            manifest = out_of_core.partition_by_week(file_location, partition_dir, chunksize=3)
+            self.assertEqual(manifest['weeks'], [1, 2, 3])
+            self.assertEqual(manifest['dimension_values']['browser'], ['Chrome', 'Firefox', 'Safari'])
+
+            for dimensions in (['country'], ['country', 'browser']):
+                for sparse in (False, True):
+                    written = out_of_core.decompose_out_of_core(partition_dir, dimensions, output_file, sparse=sparse)
+                    expected = processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, sparse=sparse)
+                    expected = expected.astype({dimension: object for dimension in dimensions})
+                    self.assertEqual(written, len(expected))
+                    pd.testing.assert_frame_equal(out_of_core.read_results(output_file, dimensions), expected)
+
+            pd.testing.assert_frame_equal(
+                out_of_core.weekly_aggregates_out_of_core(partition_dir), processor.transform_data(metrics_df))
+
+            # Partitioning again replaces the previous partitions
+            out_of_core.partition_by_week(file_location, partition_dir)
+            self.assertEqual(out_of_core.read_partition(partition_dir, 1, ['country', 'browser'])['visits'].sum(),
+                             metrics_df.loc[metrics_df['week'] == 1, 'visits'].sum())
+
+            with self.assertRaises(ValueError):
+                out_of_core.decompose_out_of_core(partition_dir, ['device'], output_file)
+
+    def test_missing_dimension_values(self):
+        # read_csv parses the country code NA as a missing value
+        metrics_df = sample_metrics()
+        metrics_df.loc[[0, 4, 7], 'country'] = 'NA'
+        processor = dataProcessing(plot=False)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_location = os.path.join(tmp_dir, 'metrics.csv')
+            partition_dir = os.path.join(tmp_dir, 'partitions')
+            output_file = os.path.join(tmp_dir, 'results.csv')
+            metrics_df.to_csv(file_location, index=False)
+            raw_df = processor.read_csv_from_filepath(file_location)
+
+            out_of_core.partition_by_week(file_location, partition_dir, chunksize=3)
+            with open(os.path.join(partition_dir, out_of_core.MANIFEST_FILE)) as file:
+                self.assertEqual(json.load(file, parse_constant=self.fail)['dimension_values']['country'], [None, 'B', 'A', 'C'])
+
+            for sparse in (False, True):
+                out_of_core.decompose_out_of_core(partition_dir, ['country', 'browser'], output_file, sparse=sparse)
+                expected = processor.decompose_and_calculate_effects_by_dimension(raw_df, ['country', 'browser'], sparse=sparse)
+                expected = expected.astype({'country': object, 'browser': object})
+                pd.testing.assert_frame_equal(out_of_core.read_results(output_file, ['country', 'browser']), expected)
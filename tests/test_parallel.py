@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.data_processing import dataProcessing
+from src.parallel import decompose_in_parallel
+from tests.fixtures import sample_metrics
+
+
+class TestParallelDecomposition(unittest.TestCase):
+
+    def test_parallel_matches_serial(self):
+        # Shuffle the rows so the workers have to regroup them by week
+        metrics_df = sample_metrics().sample(frac=1, random_state=0)
+        processor = dataProcessing()
+        dimension_sets = [['country'], ['country', 'browser'], ['browser']]
+
+        for sparse in (False, True):
+            results = decompose_in_parallel(metrics_df, dimension_sets, workers=2, sparse=sparse)
+            self.assertEqual(len(results), len(dimension_sets))
+            for dimensions, results_df in zip(dimension_sets, results):
+                pd.testing.assert_frame_equal(
+                    results_df,
+                    processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, sparse=sparse))
+
+        pd.testing.assert_frame_equal(
+            processor.decompose_and_calculate_effects_by_dimension(metrics_df, ['country', 'browser'], workers=2),
+            processor.decompose_and_calculate_effects_by_dimension(metrics_df, ['country', 'browser']))
+
+        # The workers compute the effects with the backend of the caller
+        with self.assertRaises(ValueError):
+            decompose_in_parallel(metrics_df, [['country']], workers=2, effects_backend='fortran')
+
+    def test_parallel_missing_dimension_values(self):
+        metrics_df = sample_metrics()
+        # The country code NA is parsed as a missing value
+        metrics_df.loc[[1, 5, 8], 'country'] = np.nan
+        processor = dataProcessing()
+        dimension_sets = [['country'], ['country', 'browser']]
+
+        for sparse in (False, True):
+            results = decompose_in_parallel(metrics_df, dimension_sets, workers=2, sparse=sparse)
+            for dimensions, results_df in zip(dimension_sets, results):
+                pd.testing.assert_frame_equal(
+                    results_df,
+                    processor.decompose_and_calculate_effects_by_dimension(metrics_df, dimensions, sparse=sparse))
@@ -0,0 +1,44 @@
+import unittest
+import pandas as pd
+from src.data_processing import dataProcessing
+from src.periods import periodComparison
+from tests.fixtures import sample_metrics
+
+
+class TestPeriodComparison(unittest.TestCase):
+
+    def test_week_over_one_week_matches_decomposition(self):
+        metrics_df = sample_metrics()
+        dimensions = ['country', 'browser']
+
+        results_df = periodComparison(metrics_df, dimensions).week_over_n(1)
+        self.assertTrue((results_df['baseline_start'] == results_df['baseline_end']).all())
+        results_df = results_df.drop(columns=['baseline_end', 'comparison_end']).rename(
+            columns={'baseline_start': 'week_before', 'comparison_start': 'week_after'})
+
+        expected = dataProcessing().decompose_and_calculate_effects_by_dimension(metrics_df, dimensions)
+        pd.testing.assert_frame_equal(results_df, expected)
+
+    def test_window_comparison_matches_relabelled_weeks(self):
+        metrics_df = sample_metrics()
+        comparison = periodComparison(dataProcessing().build_cube(metrics_df), ['country'])
+        results_df = comparison.compare((1, 2), 3, sparse=True)
+        self.assertEqual(results_df[['baseline_start', 'baseline_end', 'comparison_start', 'comparison_end']].drop_duplicates().values.tolist(),
+                         [[1, 2, 3, 3]])
+
+        # Summing weeks 1 and 2 into one week gives the same decomposition
+        relabelled_df = metrics_df.assign(week=metrics_df['week'].map({1: 1, 2: 1, 3: 2}))
+        expected = dataProcessing().decompose_and_calculate_effects_by_dimension(relabelled_df, ['country'], sparse=True)
+        self.assertEqual(results_df['country'].tolist(), list(expected['country']))
+        pd.testing.assert_series_equal(results_df['rate_change_effect'], expected['rate_change_effect'])
+        pd.testing.assert_series_equal(results_df['proportion_change_effect'], expected['proportion_change_effect'])
+
+    def test_rolling_and_invalid_periods(self):
+        metrics_df = sample_metrics()
+        comparison = periodComparison(metrics_df, ['browser'])
+        self.assertEqual(comparison.rolling(1)[['baseline_start', 'comparison_start']].drop_duplicates().values.tolist(), [[1, 2], [2, 3]])
+        self.assertTrue(comparison.rolling(2).empty)
+        with self.assertRaises(ValueError):
+            comparison.compare(10, 3)
+        with self.assertRaises(ValueError):
+            comparison.compare((3, 1), 2)
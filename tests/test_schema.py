@@ -0,0 +1,39 @@
+import unittest
+import warnings
+import pandas as pd
+from src import schema
+
+
+class TestSchema(unittest.TestCase):
+
+    def test_to_compact_dtypes(self):
+        metrics_df = pd.DataFrame({
+            'week': [1, 2],
+            'browser': ['Chrome', 'Firefox'],
+            'country': ['A', 'A'],
+            'visits': [1000, 2000],
+            'conversions': [100, 200]
+        })
+
+        compact_df = schema.to_compact_dtypes(metrics_df)
+
+        self.assertIsInstance(compact_df['country'].dtype, pd.CategoricalDtype)
+        self.assertEqual(compact_df['visits'].dtype, 'uint32')
+        self.assertEqual(compact_df['week'].dtype, 'uint16')
+        self.assertEqual(compact_df['visits'].sum(), 3000)
+
+    def test_counter_overflow_is_rejected(self):
+        metrics_df = pd.DataFrame({'visits': [5000000000], 'conversions': [1]})
+        with self.assertRaises(ValueError):
+            schema.to_compact_dtypes(metrics_df)
+
+        with self.assertRaises(ValueError):
+            schema.validate_counter_ranges(pd.DataFrame({'visits': [-1], 'conversions': [0]}))
+
+    def test_counter_overflow_risk_warns(self):
+        metrics_df = pd.DataFrame({'visits': [3000000000], 'conversions': [1]})
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            schema.validate_counter_ranges(metrics_df)
+        self.assertEqual(len(caught), 1)
+        self.assertIn('visits', str(caught[0].message))
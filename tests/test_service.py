@@ -0,0 +1,97 @@
+import importlib.util
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from src.data_processing import dataProcessing
+from src.service import analysisService, make_server
+from tests.fixtures import sample_metrics
+
+
+class TestAnalysisService(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics_df = sample_metrics()
+        self.server = make_server(analysisService(self.metrics_df), port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def get(self, path: str):
+        with urllib.request.urlopen(self.url + path) as response:
+            return response.headers['Content-Type'], response.read()
+
+    def test_concurrent_decomposition_queries(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: self.get('/decompose?dimensions=country,browser'), range(16)))
+        expected = dataProcessing().decompose_and_calculate_effects_by_dimension(self.metrics_df, ['country', 'browser'])
+        for content_type, body in responses:
+            self.assertEqual(content_type, 'application/json')
+            pd.testing.assert_frame_equal(pd.DataFrame(json.loads(body)), expected)
+
+        _, weekly = self.get('/weekly')
+        self.assertEqual([row['week'] for row in json.loads(weekly)], [1, 2, 3])
+
+        stats = json.loads(self.get('/stats')[1])
+        self.assertEqual(stats['results']['miss'], 2)
+        self.assertEqual(stats['results']['hit'], 15)
+        self.assertEqual(stats['latency']['/decompose']['requests'], 16)
+
+    def test_invalid_queries(self):
+        for path, status in [('/decompose?dimensions=city', 400), ('/decompose', 400), ('/weekly?format=xml', 400), ('/unknown', 404)]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(path)
+            self.assertEqual(context.exception.code, status)
+
+    def test_slow_query_does_not_block_other_requests(self):
+        service = self.server.service
+        started, release = threading.Event(), threading.Event()
+        decompose = service.processor.decompose_and_calculate_effects_by_dimension
+
+        def slow_decompose(*args, **kwargs):
+            started.set()
+            release.wait(10)
+            return decompose(*args, **kwargs)
+
+        service.processor.decompose_and_calculate_effects_by_dimension = slow_decompose
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            slow = [executor.submit(self.get, '/decompose?dimensions=browser') for _ in range(2)]
+            self.assertTrue(started.wait(10))
+            # Other queries and the counters are answered while the decomposition runs
+            self.assertEqual(len(json.loads(self.get('/weekly?dimensions=country')[1])), 8)
+            self.assertEqual(json.loads(self.get('/stats')[1])['results']['miss'], 2)
+            self.assertFalse(any(future.done() for future in slow))
+            release.set()
+            self.assertEqual(slow[0].result(), slow[1].result())
+        self.assertEqual(service.stats['miss'], 2)
+
+    def test_internal_error(self):
+        service = self.server.service
+
+        def failing_decompose(*args, **kwargs):
+            raise ArithmeticError('The effects do not add up')
+
+        service.processor.decompose_and_calculate_effects_by_dimension = failing_decompose
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.get('/decompose?dimensions=country')
+        self.assertEqual(context.exception.code, 500)
+        self.assertIn('ArithmeticError', json.loads(context.exception.read())['error'])
+        self.assertEqual(service.stats_report()['latency']['/decompose']['requests'], 1)
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_arrow_output(self):
+        import pyarrow as pa
+
+        content_type, body = self.get('/weekly?dimensions=country&format=arrow')
+        self.assertEqual(content_type, 'application/vnd.apache.arrow.stream')
+        weekly_df = pa.ipc.open_stream(body).read_pandas()
+        self.assertEqual(list(weekly_df.columns), ['week', 'country', 'visits', 'conversions', 'conversion_rate'])
+        self.assertEqual(weekly_df['visits'].sum(), self.metrics_df['visits'].sum())
@@ -0,0 +1,21 @@
+import unittest
+from benchmarks import bench_startup
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_compute_path_does_not_import_matplotlib(self):
+        code = (
+            "import pandas as pd\n"
+            "from src.data_processing import dataProcessing\n"
+            "metrics_df = pd.DataFrame({'week': [1, 2], 'country': ['A', 'A'], 'browser': ['Chrome', 'Chrome'],"
+            " 'visits': [10, 20], 'conversions': [1, 3]})\n"
+            "processor = dataProcessing(plot=False)\n"
+            "processor.transform_data(metrics_df)\n"
+            "processor.analyze_metrics_per_country(metrics_df)\n"
+            "processor.decompose_and_calculate_effects_by_dimension(metrics_df, ['country'])\n"
+        )
+        for scenario in (bench_startup.SCENARIOS['import_package'], code):
+            result = bench_startup.measure(scenario, repeat=1)
+            self.assertFalse(result['matplotlib_loaded'])
+            self.assertFalse(result['numba_loaded'])